@@ -0,0 +1,210 @@
+"""Exact odds for the rules in server/game_engine.py.
+
+Dealer: draws below 17, stands on every 17 (soft too), aces count 1 or 11.
+Player: going over 21 loses at once, equal totals tie, no blackjack bonus.
+
+A shoe composition is a tuple of 10 counts: aces, twos ... nines, then all
+ten-valued cards. Everything below is exact for a given composition (cards
+are drawn without replacement) and memoized on it, so shared sub-states are
+computed once.
+
+Library API:
+    dealer_distribution(up_rank, decks=6, removed=())  -> {17: p, ... 21: p, "bust": p}
+    hit_stand_ev(player_ranks, up_rank, decks=6)        -> (ev stand, ev hit)
+    advise(total, soft, up_value, decks=6)              -> ("hit" | "stand", ev hit, ev stand)
+
+advise() reads a precomputed table (one entry per player total / soft flag /
+dealer up card) that is built once, saved next to this file as
+odds_<decks>d.json and only loaded afterwards. The table removes just the
+dealer's up card from the shoe (the usual total-dependent approximation);
+hit_stand_ev() removes the player's actual cards too.
+
+Usage (from src/):
+    python3 -m analysis.odds --build --decks 6
+    python3 -m analysis.odds --show
+"""
+import argparse
+import json
+import os
+import time
+from functools import lru_cache
+
+outcomes = (17, 18, 19, 20, 21, "bust")
+table_dir = os.path.dirname(os.path.abspath(__file__))
+
+_tables = {}
+
+
+def full_shoe(decks: int):
+    return (4 * decks,) * 9 + (16 * decks,)
+
+
+def rank_index(rank: int) -> int:
+    # card rank 1-13 -> composition index 0-9
+    return min(rank, 10) - 1
+
+
+def _remove(comp, i):
+    c = list(comp)
+    c[i] -= 1
+    return tuple(c)
+
+
+def _best(hard, aces):
+    return hard + 10 if aces and hard <= 11 else hard
+
+
+@lru_cache(maxsize=None)
+def _dealer(comp, hard, aces):
+    # probabilities of the dealer finishing on 17, 18, 19, 20, 21, bust
+    if hard > 21:
+        return (0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    best = _best(hard, aces)
+    if best >= 17:
+        final = [0.0] * 6
+        final[best - 17] = 1.0
+        return tuple(final)
+    n = sum(comp)
+    acc = [0.0] * 6
+    for i, k in enumerate(comp):
+        if k:
+            p = k / n
+            sub = _dealer(_remove(comp, i), hard + i + 1, aces or i == 0)
+            for j in range(6):
+                acc[j] += p * sub[j]
+    return tuple(acc)
+
+
+def _stand_ev(dealer, total):
+    # win on dealer bust or lower total, lose on higher, tie on equal
+    ev = dealer[5]
+    for j, t in enumerate(outcomes[:5]):
+        if t < total:
+            ev += dealer[j]
+        elif t > total:
+            ev -= dealer[j]
+    return ev
+
+
+@lru_cache(maxsize=None)
+def _player(comp, hard, aces, up):
+    # (ev stand, ev hit) for a player hand against up card index `up`,
+    # playing on perfectly after a hit
+    up_dealer = _dealer(comp, up + 1, up == 0)
+    stand = _stand_ev(up_dealer, _best(hard, aces))
+    n = sum(comp)
+    hit = 0.0
+    for i, k in enumerate(comp):
+        if k:
+            new_hard = hard + i + 1
+            if new_hard > 21:
+                hit -= k / n
+            else:
+                hit += k / n * max(_player(_remove(comp, i), new_hard, aces or i == 0, up))
+    return stand, hit
+
+
+def dealer_distribution(up_rank: int, decks: int = 6, removed=()):
+    # final-total distribution for a dealer showing up_rank (1-13), drawing
+    # the hidden card and the rest from the shoe minus `removed` ranks
+    comp = full_shoe(decks)
+    up = rank_index(up_rank)
+    for r in (up_rank,) + tuple(removed):
+        comp = _remove(comp, rank_index(r))
+    return dict(zip(outcomes, _dealer(comp, up + 1, up == 0)))
+
+
+def hit_stand_ev(player_ranks, up_rank: int, decks: int = 6):
+    # exact (ev stand, ev hit) for these player cards (ranks 1-13)
+    comp = full_shoe(decks)
+    up = rank_index(up_rank)
+    comp = _remove(comp, up)
+    hard = 0
+    aces = False
+    for r in player_ranks:
+        i = rank_index(r)
+        comp = _remove(comp, i)
+        hard += i + 1
+        aces = aces or i == 0
+    return _player(comp, hard, aces, up)
+
+
+def _table_key(total, soft, up_value):
+    return f"{total}{'s' if soft else 'h'}{up_value}"
+
+
+def build_table(decks: int = 6):
+    # every hard total 4-21 and soft total 12-21 against up cards 2-11
+    table = {}
+    for up in range(10):
+        comp = _remove(full_shoe(decks), up)
+        up_value = 11 if up == 0 else up + 1
+        for total in range(4, 22):
+            table[_table_key(total, False, up_value)] = _player(comp, total, False, up)
+        for total in range(12, 22):
+            table[_table_key(total, True, up_value)] = _player(comp, total - 10, True, up)
+        _player.cache_clear()
+        _dealer.cache_clear()
+    return table
+
+
+def table_path(decks: int) -> str:
+    return os.path.join(table_dir, f"odds_{decks}d.json")
+
+
+def save_table(table, decks: int):
+    path = table_path(decks)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"decks": decks, "ev": table}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_table(decks: int = 6):
+    # precomputed table from disk (built and saved the first time it is
+    # missing), kept in memory afterwards
+    table = _tables.get(decks)
+    if table is None:
+        try:
+            with open(table_path(decks)) as f:
+                table = {k: tuple(v) for k, v in json.load(f)["ev"].items()}
+        except (OSError, ValueError, KeyError):
+            table = build_table(decks)
+            save_table(table, decks)
+        _tables[decks] = table
+    return table
+
+
+def advise(total: int, soft: bool, up_value: int, decks: int = 6):
+    # up_value is the up card's blackjack value, 2-11 (ace = 11)
+    stand, hit = load_table(decks)[_table_key(total, soft and total >= 12, up_value)]
+    return ("hit" if hit > stand else "stand"), hit, stand
+
+
+def show(decks):
+    # basic-strategy style chart: H / S per total and dealer up card
+    ups = list(range(2, 12))
+    print("      " + " ".join(f"{'A' if u == 11 else u:>2}" for u in ups))
+    for soft, totals in ((False, range(4, 22)), (True, range(12, 22))):
+        for total in totals:
+            row = [advise(total, soft, u, decks)[0][0].upper() for u in ups]
+            print(f"{'soft' if soft else 'hard'}{total:>2} " + " ".join(f"{c:>2}" for c in row))
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--decks", type=int, default=6)
+    p.add_argument("--build", action="store_true", help="(re)build and save the advice table")
+    p.add_argument("--show", action="store_true", help="print the hit/stand chart")
+    args = p.parse_args()
+
+    if args.build:
+        start = time.perf_counter()
+        save_table(build_table(args.decks), args.decks)
+        print(f"built {table_path(args.decks)} in {time.perf_counter() - start:.1f}s")
+    if args.show or not args.build:
+        show(args.decks)
+
+
+if __name__ == "__main__":
+    main()
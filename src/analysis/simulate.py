@@ -0,0 +1,228 @@
+"""Monte Carlo simulator for the rules in server/game_engine.py, vectorized with NumPy.
+
+Rules simulated (same as round_steps):
+  - player gets 2 cards, dealer an up card and a hidden card
+  - the player hits per its strategy; going over 21 is an immediate loss
+  - dealer draws below 17, stands on every 17 (soft too), aces count 1 or 11
+  - dealer bust = win, higher total wins, equal totals tie (no blackjack bonus)
+
+Each round deals from a full shoe of `decks` decks, without replacement
+inside the round. Shoe depletion across rounds (penetration) is not modelled;
+for a player who does not count cards it does not move the averages.
+
+Strategies are vectorized: f(total, soft, up) -> bool array, True = hit.
+``stand_on(n)`` hits below n; stand_on(0) is the test suite's AlwaysStand
+and stand_on(22) its AlwaysHit.
+
+Usage (from src/):
+    python3 -m analysis.simulate --rounds 10000000 --stand-on 17
+    python3 -m analysis.simulate --rounds 20000 --check   # compare with the real engine
+"""
+import argparse
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:  # only needed for simulate(), check_engine() runs without it
+    np = None
+
+from common.cards import shoe, hand, card_code
+from common.frames import frame_decode
+from common.protocol import pack_client_payload
+
+res_tie = 0x1
+res_loss = 0x2
+res_win = 0x3
+
+
+def stand_on(n):
+    def strategy(total, soft, up):
+        return total < n
+    strategy.name = f"stand on {n}"
+    return strategy
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("analysis.simulate needs numpy (pip install numpy)")
+
+
+def _draw(counts, rows, rng):
+    # one card for each of `rows` from that row's remaining shoe, removed
+    # from it. returns values 1-10 (1 = ace)
+    c = counts[rows]
+    cum = np.cumsum(c, axis=1)
+    pick = (rng.random(len(rows)) * cum[:, -1]).astype(cum.dtype)
+    idx = (cum <= pick[:, None]).sum(axis=1)
+    counts[rows, idx] -= 1
+    return idx + 1
+
+
+def _best(hard, aces):
+    return np.where(aces & (hard <= 11), hard + 10, hard)
+
+
+def _play_batch(n, decks, strategy, rng):
+    # returns an array of result codes for n rounds
+    counts = np.empty((n, 10), dtype=np.int16)
+    counts[:, :9] = 4 * decks
+    counts[:, 9] = 16 * decks
+    every = np.arange(n)
+
+    p1 = _draw(counts, every, rng)
+    p2 = _draw(counts, every, rng)
+    up = _draw(counts, every, rng)
+    hidden = _draw(counts, every, rng)
+
+    p_hard = (p1 + p2).astype(np.int16)
+    p_aces = (p1 == 1) | (p2 == 1)
+    d_hard = (up + hidden).astype(np.int16)
+    d_aces = (up == 1) | (hidden == 1)
+    up_value = np.where(up == 1, 11, up)
+
+    # player turn: everyone still hitting gets one more card per pass
+    hitting = strategy(_best(p_hard, p_aces), p_aces & (p_hard <= 11), up_value)
+    while True:
+        rows = np.flatnonzero(hitting)
+        if len(rows) == 0:
+            break
+        v = _draw(counts, rows, rng)
+        p_hard[rows] += v
+        p_aces[rows] |= v == 1
+        total = _best(p_hard[rows], p_aces[rows])
+        still = total <= 21
+        keep = rows[still]
+        hitting[:] = False
+        hitting[keep] = strategy(total[still], (p_aces[keep] & (p_hard[keep] <= 11)), up_value[keep])
+
+    p_total = _best(p_hard, p_aces)
+    p_bust = p_hard > 21
+
+    # dealer turn, only for players who did not bust
+    drawing = ~p_bust & (_best(d_hard, d_aces) < 17)
+    while True:
+        rows = np.flatnonzero(drawing)
+        if len(rows) == 0:
+            break
+        v = _draw(counts, rows, rng)
+        d_hard[rows] += v
+        d_aces[rows] |= v == 1
+        drawing[rows] = _best(d_hard[rows], d_aces[rows]) < 17
+
+    d_total = _best(d_hard, d_aces)
+    result = np.full(n, res_tie, dtype=np.int8)
+    result[p_total > d_total] = res_win
+    result[p_total < d_total] = res_loss
+    result[d_hard > 21] = res_win
+    result[p_bust] = res_loss
+    return result
+
+
+def simulate(rounds, strategy, decks=6, seed=None, batch=1000000):
+    # plays `rounds` rounds, returns {result code: count}
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    totals = {res_win: 0, res_loss: 0, res_tie: 0}
+    left = rounds
+    while left > 0:
+        n = min(batch, left)
+        counted = np.bincount(_play_batch(n, decks, strategy, rng), minlength=4)
+        for code in totals:
+            totals[code] += int(counted[code])
+        left -= n
+    return totals
+
+
+def summarize(counts, z=1.96):
+    # rates with normal-approximation confidence intervals (default 95%),
+    # plus the player's expected value per round (win +1, loss -1, tie 0)
+    n = sum(counts.values())
+    out = {"rounds": n}
+    for name, code in (("win", res_win), ("loss", res_loss), ("tie", res_tie)):
+        p = counts[code] / n
+        out[name] = (p, z * math.sqrt(p * (1 - p) / n))
+    w, l = out["win"][0], out["loss"][0]
+    ev = w - l
+    var = (w + l) - ev * ev
+    out["ev"] = (ev, z * math.sqrt(var / n))
+    return out
+
+
+def check_engine(rounds, threshold, decks=6, seed=1):
+    # plays rounds through the real server round logic (round_steps) with a
+    # stand-on-threshold player, for cross-checking the vectorized version.
+    # pure python, no numpy needed
+    import random
+    from server.game_engine import round_steps
+
+    class quiet:
+        # stands in for the session logger
+        actions = False
+
+        def info(self, *args):
+            pass
+
+        warning = action = info
+
+    hit = pack_client_payload(b"Hittt")
+    stay = pack_client_payload(b"Stand")
+    cards = shoe(decks, 0.75, random.Random(seed))
+    counts = {res_win: 0, res_loss: 0, res_tie: 0}
+    for _ in range(rounds):
+        steps = round_steps(cards, quiet())
+        mine = hand()
+        seen = 0
+        hitting = False
+        try:
+            out = next(steps)
+            while True:
+                if out is None:
+                    hitting = mine.total() < threshold
+                    out = steps.send(hit if hitting else stay)
+                    continue
+                # the first two payloads and the one answering a hit are ours
+                seen += 1
+                if seen <= 2 or (seen > 3 and hitting):
+                    _res, rank, suit = frame_decode[out]
+                    mine.add(card_code(rank, suit))
+                out = next(steps)
+        except StopIteration as stop:
+            counts[stop.value] += 1
+    return counts
+
+
+def print_summary(title, s):
+    print(f"{title}: {s['rounds']} rounds")
+    for name in ("win", "loss", "tie"):
+        p, ci = s[name]
+        print(f"  {name:<5}{p:>9.4%}  +/- {ci:.4%}")
+    ev, ci = s["ev"]
+    print(f"  ev   {ev:>+9.4f}  +/- {ci:.4f} per round (house edge {-ev:.2%})")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rounds", type=int, default=10000000)
+    p.add_argument("--stand-on", type=int, default=17, help="player hits below this total")
+    p.add_argument("--decks", type=int, default=6)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--batch", type=int, default=1000000, help="rounds per numpy batch")
+    p.add_argument("--check", action="store_true", help="also play --rounds through the real engine")
+    args = p.parse_args()
+
+    strategy = stand_on(args.stand_on)
+    if args.check:
+        start = time.perf_counter()
+        counts = check_engine(args.rounds, args.stand_on, args.decks, args.seed or 1)
+        print_summary(f"engine ({time.perf_counter() - start:.1f}s)", summarize(counts))
+
+    start = time.perf_counter()
+    counts = simulate(args.rounds, strategy, args.decks, args.seed, args.batch)
+    elapsed = time.perf_counter() - start
+    print_summary(f"numpy, {strategy.name}, {args.decks} decks", summarize(counts))
+    print(f"  {args.rounds / elapsed * 60 / 1e6:.1f}M rounds/minute")
+
+
+if __name__ == "__main__":
+    main()
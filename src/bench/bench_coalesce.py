@@ -0,0 +1,114 @@
+"""Send syscalls per round and first-card latency, coalesced vs one send per payload.
+
+Runs the threaded server in this process. Every accepted socket is wrapped in
+a proxy that counts send syscalls. The "per-payload" row turns every
+scatter-gather flush back into one sendall per payload and switches
+TCP_NODELAY off, which is how the server used to write.
+
+Latency is measured on the client: from sending the request (or the Stand of
+the previous round) to receiving the first card of the round.
+
+Usage (from src/):
+    python3 -m bench.bench_coalesce --sessions 20 --rounds 50
+"""
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from common.constants import server_payload_len
+from common.net_utils import recv_exact
+from common.protocol import pack_request, pack_client_payload, unpack_server_payload
+from server.game_engine import handle_client
+from server.log import setup_logging
+from server.tcp_server import run_tcp_server
+
+
+class counting_socket:
+    # forwards to a real socket and counts the send syscalls made on it
+    def __init__(self, sock, stats, per_payload):
+        self._sock = sock
+        self._stats = stats
+        self._per_payload = per_payload
+        if per_payload:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+
+    def sendmsg(self, parts):
+        if self._per_payload:
+            for p in parts:
+                self.sendall(p)
+            return sum(len(p) for p in parts)
+        self._stats["sends"] += 1
+        return self._sock.sendmsg(parts)
+
+    def sendall(self, data):
+        self._stats["sends"] += 1
+        return self._sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def start(per_payload):
+    stats = {"sends": 0}
+
+    def handler(conn, addr):
+        handle_client(counting_socket(conn, stats, per_payload), addr)
+
+    port = run_tcp_server("127.0.0.1", 0, handler)
+    return port, stats
+
+
+def session(port, rounds, latencies):
+    s = socket.create_connection(("127.0.0.1", port))
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    t0 = time.perf_counter()
+    s.sendall(pack_request(rounds, "Bench"))
+    for _ in range(rounds):
+        recv_exact(s, server_payload_len)
+        latencies.append(time.perf_counter() - t0)
+        recv_exact(s, 2 * server_payload_len)
+        t0 = time.perf_counter()
+        s.sendall(pack_client_payload(b"Stand"))
+        while unpack_server_payload(recv_exact(s, server_payload_len))[0] == 0:
+            pass
+    s.close()
+
+
+def run(per_payload, sessions, rounds):
+    port, stats = start(per_payload)
+    latencies = []
+    ts = [threading.Thread(target=session, args=(port, rounds, latencies)) for _ in range(sessions)]
+    start_t = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start_t
+    total = sessions * rounds
+    latencies.sort()
+    return {
+        "sends_per_round": stats["sends"] / total,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "rounds_per_sec": total / elapsed,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sessions", type=int, default=20)
+    p.add_argument("--rounds", type=int, default=50)
+    args = p.parse_args()
+    setup_logging("off")
+
+    print(f"{'writes':<14}{'sends/round':>12}{'first card p50':>16}{'p99':>10}{'rounds/s':>10}")
+    for name, per_payload in (("per-payload", True), ("coalesced", False)):
+        r = run(per_payload, args.sessions, args.rounds)
+        print(f"{name:<14}{r['sends_per_round']:>12.2f}{r['p50_ms']:>14.3f}ms{r['p99_ms']:>8.3f}ms"
+              f"{r['rounds_per_sec']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
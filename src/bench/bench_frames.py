@@ -0,0 +1,70 @@
+"""Per-frame cost of building and parsing server payloads, table vs pack/unpack.
+
+Usage (from src/):
+    python3 -m bench.bench_frames --n 1000000
+"""
+import argparse
+import random
+import timeit
+
+from common.cards import encode_card, decode_card, card_code, card_of_code
+from common.frames import server_frames, frame_decode, decode_server_frame
+from common.protocol import pack_server_payload, unpack_server_payload
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--n", type=int, default=1000000, help="frames per measurement")
+    args = p.parse_args()
+
+    rng = random.Random(1)
+    cards = [(rng.randrange(4), card_of_code[rng.randrange(52)]) for _ in range(1024)]
+    codes = [(res, card_code(*c)) for res, c in cards]
+    frames = [server_frames[res][code] for res, code in codes]
+    loops = max(1, args.n // len(cards))
+
+    def build_packed():
+        for res, (rank, suit) in cards:
+            pack_server_payload(res, encode_card(rank, suit))
+
+    def build_table():
+        for res, code in codes:
+            server_frames[res][code]
+
+    def parse_unpacked():
+        for f in frames:
+            res, card3 = unpack_server_payload(f)
+            decode_card(card3)
+
+    def parse_table():
+        for f in frames:
+            frame_decode[f]
+
+    def parse_table_fallback():
+        for f in frames:
+            decode_server_frame(f)
+
+    # the client's case: frames are memoryviews into a frame_reader buffer
+    received = memoryview(bytearray(b"".join(frames)))
+    views = [received[i:i + 9] for i in range(0, len(received), 9)]
+
+    def parse_view_copy():
+        for v in views:
+            decode_server_frame(bytes(v))
+
+    rows = [
+        ("build: pack_server_payload(encode_card)", build_packed),
+        ("build: server_frames[res][code]", build_table),
+        ("parse: unpack_server_payload + decode_card", parse_unpacked),
+        ("parse: frame_decode[frame]", parse_table),
+        ("parse: decode_server_frame", parse_table_fallback),
+        ("parse view: bytes() + decode_server_frame", parse_view_copy),
+    ]
+    print(f"{'operation':<46}{'ns/frame':>10}")
+    for name, fn in rows:
+        best = min(timeit.repeat(fn, number=loops, repeat=3))
+        print(f"{name:<46}{best / (loops * len(cards)) * 1e9:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
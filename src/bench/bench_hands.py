@@ -0,0 +1,75 @@
+"""Hand evaluation: the old rescanning hand vs the incremental one.
+
+Every hand gets 2 cards plus 0-3 hits, with total() and is_bust() asked
+after each card the way play_one_round and the client do.
+
+Usage (from src/):
+    python3 -m bench.bench_hands --hands 2000000
+"""
+import argparse
+import random
+import time
+
+from common.cards import hand, card_of_code, rank_value
+
+
+class rescan_hand:
+    # the previous hand: list of (rank, suit), total() walks it every time
+    # (and counts every ace as 11)
+    def __init__(self):
+        self.items = []
+
+    def add(self, card):
+        self.items.append(card)
+
+    def total(self) -> int:
+        s = 0
+        for r, _ in self.items:
+            s += rank_value(r)
+        return s
+
+    def is_bust(self) -> bool:
+        return self.total() > 21
+
+
+def deals(n, seed=1):
+    rng = random.Random(seed)
+    return [[rng.randrange(52) for _ in range(2 + rng.randrange(4))] for _ in range(n)]
+
+
+def run_rescan(hands):
+    for codes in hands:
+        h = rescan_hand()
+        for c in codes:
+            h.add(card_of_code[c])
+            h.total()
+            h.is_bust()
+        h.total()
+
+
+def run_incremental(hands):
+    for codes in hands:
+        h = hand()
+        for c in codes:
+            h.add(c)
+            h.total()
+            h.is_bust()
+        h.total()
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--hands", type=int, default=2000000)
+    args = p.parse_args()
+
+    hands = deals(args.hands)
+    print(f"{'hand':<14}{'hands/s':>12}{'ns/hand':>10}")
+    for name, fn in (("rescan", run_rescan), ("incremental", run_incremental)):
+        start = time.perf_counter()
+        fn(hands)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14}{args.hands / elapsed:>12.0f}{elapsed / args.hands * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Rounds/sec of the server round logic at different log levels.
+
+Every thread plays rounds through round_steps (no sockets) with a session
+logger, the way session threads do on a busy server. The log output goes to
+/dev/null (or --out), so the numbers show what the round loop pays, not how
+fast the terminal is.
+
+Usage (from src/):
+    python3 -m bench.bench_logging --rounds 20000 --threads 8
+"""
+import argparse
+import os
+import threading
+import time
+
+from bench.local_rounds import play_local_round
+from server.game_engine import new_shoe
+from server.log import setup_logging, stop_logging, session_log
+
+
+def run(level, rounds, threads, sample, out):
+    with open(out, "w") as stream:
+        setup_logging(level, sample, stream)
+        per_thread = rounds // threads
+
+        def worker(i):
+            # a new session every 10 rounds, so sampling picks whole sessions
+            for n in range(per_thread):
+                if n % 10 == 0:
+                    slog = session_log(f"bench-{i}-{n // 10}")
+                    cards = new_shoe()
+                play_local_round(cards, slog)
+
+        ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        elapsed = time.perf_counter() - start
+        stop_logging()  # drain the queue so the next level starts clean
+    return per_thread * threads / elapsed
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rounds", type=int, default=20000)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--sample", type=float, default=0.1, help="action sample rate for the debug+sample row")
+    p.add_argument("--out", default=os.devnull, help="where log lines are written")
+    args = p.parse_args()
+
+    rows = [
+        ("debug", "debug", 1.0),
+        (f"debug, {args.sample:.0%} sampled", "debug", args.sample),
+        ("info", "info", 1.0),
+        ("off", "off", 1.0),
+    ]
+    print(f"{'log level':<24}{'rounds/s':>12}")
+    for name, level, sample in rows:
+        rps = run(level, args.rounds, args.threads, sample, args.out)
+        print(f"{name:<24}{rps:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Cost of the metrics hooks on the round hot path.
+
+Plays rounds through round_steps in-process (no sockets) the way the drivers
+do, once bare and once with the two perf_counter calls and the
+metrics.round_done() call that play_one_round adds, and reports ns per round
+and the overhead. Also times one /metrics render.
+
+Usage (from src/):
+    python3 -m bench.bench_metrics --rounds 200000
+"""
+import argparse
+import logging
+import random
+import time
+
+from common.cards import shoe
+from server import metrics
+from server.log import session_log, log
+from bench.local_rounds import play_local_round
+
+
+def bare(cards, slog, rounds):
+    for _ in range(rounds):
+        play_local_round(cards, slog)
+
+
+def counted(cards, slog, rounds):
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result, sent = play_local_round(cards, slog)
+        metrics.round_done(result, time.perf_counter() - start, 10, sent * 9)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rounds", type=int, default=200000)
+    p.add_argument("--repeat", type=int, default=3, help="best of N runs per variant")
+    args = p.parse_args()
+
+    log.setLevel(logging.CRITICAL + 1)  # logging off, so the hooks are not hidden behind it
+    slog = session_log("bench")
+    timings = {}
+    for name, fn in (("bare", bare), ("metrics", counted)):
+        best = None
+        for _ in range(args.repeat):
+            cards = shoe(6, 0.75, random.Random(1))
+            start = time.perf_counter()
+            fn(cards, slog, args.rounds)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best / args.rounds * 1e9
+
+    for name, ns in timings.items():
+        print(f"{name:<10}{ns:>10.0f} ns/round")
+    extra = timings["metrics"] - timings["bare"]
+    print(f"overhead  {extra:>10.0f} ns/round ({extra / timings['bare']:.1%})")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        metrics.render()
+    print(f"render    {(time.perf_counter() - start) / 1000 * 1e6:>10.1f} us/scrape")
+
+
+if __name__ == "__main__":
+    main()
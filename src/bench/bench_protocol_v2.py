@@ -0,0 +1,164 @@
+"""Protocol v1 vs v2: bytes per round on the wire and codec cost per round.
+
+Plays --rounds rounds per strategy through game_engine.round_steps (no
+sockets) and groups the payloads the way the drivers flush them: everything
+queued goes out right before the server waits for a decision. The same
+writes are then priced in both framings:
+  - v1: 9 bytes per card, 10 per decision, 38-byte request
+  - v2: one cards frame per flush (3 + 1 per card), one decisions frame per
+    client write (3 + 1 per decision), 42-byte hello, welcome frame
+Writes per round are the same in both, v2 only makes them smaller.
+"plan" sends two hits and a stand in one write (pipelined, see
+test_edge_cases.run_pipelined_session).
+
+The codec rows time encoding one round's flushes to wire bytes and decoding
+them back to (result, rank, suit): through v1 payloads the way the client's
+payload_reader does, and straight from the card bytes.
+
+Usage (from src/):
+    python3 -m bench.bench_protocol_v2 --rounds 20000
+"""
+import argparse
+import random
+import timeit
+
+from common.constants import client_payload_len, server_payload_len, request_len, request_v2_len
+from common.frames import frame_decode
+from common.protocol import pack_client_payload
+from common.protocol_v2 import (pack_cards, pack_decisions, card_payloads, card_decode, frame_decoder, pack_welcome,
+                                frame_header_len, ext_rounds)
+from server.game_engine import round_steps, new_shoe
+from server.log import quiet_log
+from test_edge_cases import AlwaysHit, AlwaysStand, RandomStrategy
+
+
+class plan_strategy:
+    # two hits and a stand, all sent at the first decision
+    def next_plan(self):
+        return [b"Hittt", b"Hittt", b"Stand"]
+
+
+strategies = {"stand": AlwaysStand, "hit": AlwaysHit, "random": RandomStrategy, "plan": plan_strategy}
+
+
+def simulate(rounds, strategy, seed=1):
+    # returns (flushes, writes, flush payloads): cards per server flush,
+    # decisions per client write, and the payload lists of the flushes
+    slog = quiet_log("bench")
+    cards = new_shoe(random.Random(seed))
+    flushes, writes, groups = [], [], []
+    pending = []
+    for _ in range(rounds):
+        strat = strategies[strategy]()
+        queued = []
+        steps = round_steps(cards, slog)
+        try:
+            out = next(steps)
+            while True:
+                if out is None:
+                    if not queued:
+                        # nothing sent ahead: flush, then the client answers
+                        flushes.append(len(pending))
+                        groups.append(pending)
+                        pending = []
+                        queued = strat.next_plan() if strategy == "plan" else [strat.next_decision()]
+                        writes.append(len(queued))
+                    out = steps.send(pack_client_payload(queued.pop(0)))
+                else:
+                    pending.append(out)
+                    out = next(steps)
+        except StopIteration:
+            pass
+    flushes.append(len(pending))
+    groups.append(pending)
+    return flushes, writes, groups
+
+
+def wire_bytes(flushes, writes):
+    # (v1 server->client, v1 client->server, v2 server->client, v2 client->server)
+    welcome = len(pack_welcome(1, {ext_rounds: bytes(4)}))
+    v1_out = server_payload_len * sum(flushes)
+    v1_in = request_len + client_payload_len * sum(writes)
+    v2_out = welcome + sum(frame_header_len + n for n in flushes if n)
+    v2_in = request_v2_len + sum(frame_header_len + n for n in writes)
+    return v1_out, v1_in, v2_out, v2_in
+
+
+def codec_rows(groups, writes):
+    groups = [g for g in groups if g]
+    v1_wire = [b"".join(g) for g in groups]
+    v2_wire = [pack_cards(g) for g in groups]
+    hit, stand = pack_client_payload(b"Hittt"), pack_client_payload(b"Stand")
+    plans = [[hit] * (n - 1) + [stand] for n in writes]
+
+    def enc_v1():
+        for g in groups:
+            b"".join(g)
+
+    def enc_v2():
+        for g in groups:
+            pack_cards(g)
+
+    def dec_v1():
+        for data in v1_wire:
+            for i in range(0, len(data), server_payload_len):
+                frame_decode[data[i:i + server_payload_len]]
+
+    def dec_v2():
+        decoder = frame_decoder()
+        for data in v2_wire:
+            for _kind, body in decoder.feed(data):
+                for p in card_payloads(body):
+                    frame_decode[p]
+
+    def dec_v2_direct():
+        decoder = frame_decoder()
+        for data in v2_wire:
+            for _kind, body in decoder.feed(data):
+                for b in body:
+                    card_decode[b]
+
+    def decisions_v1():
+        for plan in plans:
+            b"".join(plan)
+
+    def decisions_v2():
+        for plan in plans:
+            pack_decisions(plan)
+
+    return [
+        ("encode cards, v1 (join payloads)", enc_v1),
+        ("encode cards, v2 (pack_cards)", enc_v2),
+        ("decode cards, v1 (slice + frame_decode)", dec_v1),
+        ("decode cards, v2 (via v1 payloads, the client)", dec_v2),
+        ("decode cards, v2 (card_decode table)", dec_v2_direct),
+        ("encode decisions, v1 (join payloads)", decisions_v1),
+        ("encode decisions, v2 (pack_decisions)", decisions_v2),
+    ]
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rounds", type=int, default=20000, help="rounds per strategy")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    print(f"{'strategy':<10}{'writes/rnd':>11}{'v1 B/rnd':>10}{'v2 B/rnd':>10}{'v2/v1':>7}"
+          f"{'v1 down':>9}{'v2 down':>9}{'v1 up':>7}{'v2 up':>7}")
+    for name in strategies:
+        flushes, writes, _ = simulate(args.rounds, name, args.seed)
+        v1_out, v1_in, v2_out, v2_in = wire_bytes(flushes, writes)
+        r = args.rounds
+        print(f"{name:<10}{(len(flushes) + len(writes)) / r:>11.2f}{(v1_out + v1_in) / r:>10.1f}"
+              f"{(v2_out + v2_in) / r:>10.1f}{(v2_out + v2_in) / (v1_out + v1_in):>7.2f}"
+              f"{v1_out / r:>9.1f}{v2_out / r:>9.1f}{v1_in / r:>7.1f}{v2_in / r:>7.1f}")
+
+    _, writes, groups = simulate(args.rounds, "random", args.seed)
+    print(f"\n{'codec (random strategy)':<48}{'ns/round':>10}")
+    for name, fn in codec_rows(groups, writes):
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{name:<48}{best / args.rounds * 1e9:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""recv_exact vs frame_reader: time and recv syscalls per message.
+
+A writer thread pushes 9-byte server payloads through a socketpair in bursts
+(the coalesced server sends up to a handful back to back) and the reader
+consumes them one message at a time, the way the client does.
+
+Per message recv_exact allocates a list, one bytes object per recv and the
+joined result; frame_reader allocates one memoryview slice and only calls
+recv_into when its buffer has no complete message left. read_frames takes
+every complete message already buffered in one call.
+
+Usage (from src/):
+    python3 -m bench.bench_reader --frames 200000 --burst 3
+"""
+import argparse
+import socket
+import threading
+import time
+
+from common.constants import server_payload_len
+from common.frames import server_frames
+from common.net_utils import recv_exact, frame_reader
+
+
+class counting_socket:
+    # counts recv / recv_into calls on a real socket
+    def __init__(self, sock):
+        self._sock = sock
+        self.calls = 0
+
+    def recv(self, n):
+        self.calls += 1
+        return self._sock.recv(n)
+
+    def recv_into(self, buf):
+        self.calls += 1
+        return self._sock.recv_into(buf)
+
+
+def writer(sock, frames, burst):
+    chunk = b"".join(server_frames[0][i % 52] for i in range(burst))
+    for _ in range(frames // burst):
+        sock.sendall(chunk)
+
+
+def run(kind, frames, burst):
+    a, b = socket.socketpair()
+    counted = counting_socket(b)
+    t = threading.Thread(target=writer, args=(a, frames, burst))
+    frames = frames // burst * burst
+    t.start()
+    start = time.perf_counter()
+    if kind == "recv_exact":
+        for _ in range(frames):
+            recv_exact(counted, server_payload_len)
+    elif kind == "frame_reader":
+        reader = frame_reader(counted)
+        for _ in range(frames):
+            reader.read(server_payload_len)
+    else:
+        reader = frame_reader(counted)
+        got = 0
+        while got < frames:
+            got += len(reader.read_frames(server_payload_len))
+    elapsed = time.perf_counter() - start
+    t.join()
+    a.close()
+    b.close()
+    return elapsed / frames * 1e9, counted.calls / frames
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--frames", type=int, default=200000)
+    p.add_argument("--burst", type=int, default=3, help="frames sent per write")
+    args = p.parse_args()
+
+    print(f"{'reader':<14}{'ns/msg':>10}{'recv/msg':>10}")
+    for kind in ("recv_exact", "frame_reader", "read_frames"):
+        ns, calls = run(kind, args.frames, args.burst)
+        print(f"{kind:<14}{ns:>10.0f}{calls:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
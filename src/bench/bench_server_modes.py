@@ -0,0 +1,184 @@
+"""Side-by-side benchmark of the server modes.
+
+Starts ``server.main_server`` in a child process for every mode and measures:
+
+  1. sessions held: how many clients can sit in the decision phase at once
+     (connected, handshake done, initial cards received, no decision sent).
+  2. rss of the server process while those sessions are held.
+  3. rounds/sec: many clients playing always-stand rounds back to back.
+
+The load is generated with asyncio from this process so the client side is
+never the thing that runs out of threads.
+
+Usage (from src/):
+    python3 -m bench.bench_server_modes --sessions 10000 --clients 200 --rounds 20
+    python3 -m bench.bench_server_modes --modes async,async:2,async:4   # worker scaling
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from common.constants import server_payload_len
+from common.protocol import pack_request, pack_client_payload, unpack_server_payload
+
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def raise_fd_limit():
+    # children inherit this, so both sides can hold the requested sessions
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(extra_args):
+    # returns (process, port) once the server accepts connections
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "server.main_server", "--port", str(port)] + list(extra_args),
+        cwd=src_dir, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not come up")
+
+
+def stop_server(proc):
+    proc.kill()
+    proc.wait()
+
+
+def rss_kb(pid):
+    # resident set size of a process, including all of its children
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(x) for x in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+async def hold_session(port, held):
+    # connect, handshake, take the initial deal and then just sit there
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(pack_request(1, "Holder"))
+        await reader.readexactly(3 * server_payload_len)
+    except (OSError, asyncio.IncompleteReadError):
+        return
+    held.append(writer)
+
+
+async def measure_held(port, n, timeout):
+    held = []
+    tasks = [asyncio.ensure_future(hold_session(port, held)) for _ in range(n)]
+    await asyncio.wait(tasks, timeout=timeout)
+    for t in tasks:
+        t.cancel()
+    return held
+
+
+async def play_rounds(port, rounds):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(pack_request(rounds, "Bench"))
+    for _ in range(rounds):
+        await reader.readexactly(3 * server_payload_len)
+        writer.write(pack_client_payload(b"Stand"))
+        while True:
+            res, _card = unpack_server_payload(await reader.readexactly(server_payload_len))
+            if res != 0:
+                break
+    writer.close()
+    return rounds
+
+
+async def measure_throughput(port, clients, rounds):
+    start = time.perf_counter()
+    done = await asyncio.gather(*(play_rounds(port, rounds) for _ in range(clients)))
+    return sum(done) / (time.perf_counter() - start)
+
+
+def bench_mode(name, extra_args, sessions, clients, rounds, timeout):
+    proc, port = start_server(extra_args)
+    try:
+        idle_rss = rss_kb(proc.pid)
+        rps = asyncio.run(measure_throughput(port, clients, rounds))
+
+        async def held_phase():
+            held = await measure_held(port, sessions, timeout)
+            await asyncio.sleep(0.5)
+            rss = rss_kb(proc.pid)
+            for w in held:
+                w.close()
+            return len(held), rss
+
+        held, held_rss = asyncio.run(held_phase())
+    finally:
+        stop_server(proc)
+    return {"mode": name, "held": held, "idle_rss_kb": idle_rss,
+            "held_rss_kb": held_rss, "rounds_per_sec": rps}
+
+
+def print_table(rows):
+    print(f"{'mode':<22}{'held':>8}{'idle rss':>12}{'held rss':>12}{'kb/session':>12}{'rounds/s':>12}")
+    for r in rows:
+        per = (r["held_rss_kb"] - r["idle_rss_kb"]) / r["held"] if r["held"] else 0
+        print(f"{r['mode']:<22}{r['held']:>8}{r['idle_rss_kb']:>10}kb{r['held_rss_kb']:>10}kb"
+              f"{per:>12.1f}{r['rounds_per_sec']:>12.0f}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sessions", type=int, default=2000, help="idle sessions to try to hold")
+    p.add_argument("--clients", type=int, default=100, help="concurrent clients for rounds/sec")
+    p.add_argument("--rounds", type=int, default=20, help="rounds per client for rounds/sec")
+    p.add_argument("--timeout", type=float, default=60.0, help="seconds allowed to open the sessions")
+    p.add_argument("--modes", default="threaded,async",
+                   help="comma separated server modes, mode:N runs N worker processes (e.g. async:4)")
+    args = p.parse_args()
+
+    limit = raise_fd_limit()
+    if args.sessions * 2 + 64 > limit:
+        print(f"warning: fd limit is {limit}, holding {args.sessions} sessions on one host needs ~{args.sessions * 2}")
+
+    rows = []
+    for spec in args.modes.split(","):
+        mode, _, workers = spec.partition(":")
+        extra = ["--mode", mode] + (["--workers", workers] if workers else [])
+        print(f"running {spec}...")
+        rows.append(bench_mode(spec, extra, args.sessions, args.clients, args.rounds, args.timeout))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
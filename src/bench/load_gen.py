@@ -0,0 +1,248 @@
+"""Load generator: many concurrent sessions driven by the test suite's strategies.
+
+Every session connects, asks for --rounds rounds and plays them with a fresh
+AlwaysHit / AlwaysStand / RandomStrategy (from test_edge_cases) per round,
+optionally waiting a random think time before each decision. Session starts
+are spread evenly over --ramp seconds. Everything runs on one asyncio loop,
+so thousands of sessions cost the load generator no threads.
+
+Reported per run:
+  - rounds/sec over the whole run (first connect to last result)
+  - connection setup time (connect() returning), p50/p99/p999
+  - message latency: client write (request or decision) to the first server
+    frame answering it, p50/p99/p999
+
+Each run is appended as one JSON line to --results, --compare prints the
+stored runs side by side.
+
+Usage (from src/):
+    python3 -m bench.load_gen --sessions 2000 --rounds 10 --ramp 5 --think 20
+    python3 -m bench.load_gen --server async:4 --strategy random --label async-4w
+    python3 -m bench.load_gen --port 2121     # against a server that is already running
+    python3 -m bench.load_gen --autoplay 17 --rounds 100000 --sessions 10   # server-side play
+    python3 -m bench.load_gen --compare
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from common.constants import server_payload_len, results_header_len
+from common.protocol import (pack_request, pack_client_payload, unpack_server_payload, pack_autoplay_request,
+                             unpack_results_header)
+from bench.bench_server_modes import raise_fd_limit, start_server, stop_server, src_dir
+from test_edge_cases import AlwaysHit, AlwaysStand, RandomStrategy
+
+strategies = {"hit": AlwaysHit, "stand": AlwaysStand, "random": RandomStrategy}
+default_results = os.path.join(src_dir, "bench", "load_results.jsonl")
+max_request_rounds = 255  # the request's rounds field is one byte
+
+
+class run_stats:
+    def __init__(self):
+        self.connect = []   # seconds per successful connect
+        self.latency = []   # seconds per answered client message
+        self.rounds = 0
+        self.sessions = 0   # sessions that played all their rounds
+        self.errors = 0
+
+
+async def play_session(host, port, delay, strategy_factory, rounds, think, stats):
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.errors += 1
+        return
+    stats.connect.append(time.perf_counter() - start)
+    try:
+        sent_at = time.perf_counter()
+        writer.write(pack_request(rounds, "LoadGen"))
+        for _ in range(rounds):
+            strat = strategy_factory()
+            frames = 0
+            while True:
+                data = await reader.readexactly(server_payload_len)
+                if sent_at is not None:
+                    stats.latency.append(time.perf_counter() - sent_at)
+                    sent_at = None
+                res, _card = unpack_server_payload(data)
+                if res != 0:
+                    stats.rounds += 1
+                    break
+                # the first decision is due after both player cards and the up card
+                frames += 1
+                if frames < 3:
+                    continue
+                decision = strat.next_decision()
+                if decision:
+                    if think:
+                        await asyncio.sleep(random.uniform(0, 2 * think))
+                    sent_at = time.perf_counter()
+                    writer.write(pack_client_payload(decision))
+        stats.sessions += 1
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        stats.errors += 1
+    finally:
+        writer.close()
+
+
+async def autoplay_session(host, port, delay, stand_on, rounds, stats):
+    # one autoplay session: the server plays, we count result bytes.
+    # latency is request to the first results frame
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.errors += 1
+        return
+    stats.connect.append(time.perf_counter() - start)
+    try:
+        sent_at = time.perf_counter()
+        writer.write(pack_autoplay_request(rounds, stand_on, "LoadGen"))
+        done = 0
+        while done < rounds:
+            n = unpack_results_header(await reader.readexactly(results_header_len))
+            if n is None:
+                raise ValueError("bad results frame")
+            await reader.readexactly(n)
+            if sent_at is not None:
+                stats.latency.append(time.perf_counter() - sent_at)
+                sent_at = None
+            done += n
+            stats.rounds += n
+        stats.sessions += 1
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        stats.errors += 1
+    finally:
+        writer.close()
+
+
+async def generate(host, port, sessions, rounds, ramp, think, strategy_factory, timeout, autoplay=None):
+    stats = run_stats()
+    step = ramp / sessions if sessions else 0
+    start = time.perf_counter()
+    if autoplay is not None:
+        tasks = [asyncio.ensure_future(autoplay_session(host, port, i * step, autoplay, rounds, stats))
+                 for i in range(sessions)]
+    else:
+        tasks = [asyncio.ensure_future(play_session(host, port, i * step, strategy_factory, rounds, think, stats))
+                 for i in range(sessions)]
+    _done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for t in pending:
+        t.cancel()
+    stats.errors += len(pending)
+    return stats, time.perf_counter() - start
+
+
+def percentiles(values):
+    # p50/p99/p999 in milliseconds
+    if not values:
+        return {"p50": None, "p99": None, "p999": None}
+    values = sorted(values)
+    n = len(values)
+    return {name: round(values[min(n - 1, int(q * n))] * 1000, 3)
+            for name, q in (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))}
+
+
+def save_result(path, record):
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_results(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def _ms(v):
+    return f"{v:.2f}" if v is not None else "-"
+
+
+def print_results(records):
+    print(f"{'when':<20}{'label':<18}{'sess':>6}{'strat':>7}{'rounds/s':>10}{'errs':>6}"
+          f"{'conn p50':>10}{'conn p99':>10}{'msg p50':>9}{'msg p99':>9}{'msg p999':>10}")
+    for r in records:
+        c, m = r["connect_ms"], r["latency_ms"]
+        print(f"{r['when']:<20}{r['label'][:17]:<18}{r['sessions']:>6}{r['strategy']:>7}"
+              f"{r['rounds_per_sec']:>10.0f}{r['errors']:>6}"
+              f"{_ms(c['p50']):>10}{_ms(c['p99']):>10}{_ms(m['p50']):>9}{_ms(m['p99']):>9}{_ms(m['p999']):>10}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sessions", type=int, default=1000, help="concurrent sessions")
+    p.add_argument("--rounds", type=int, default=10,
+                   help="rounds per session, at most %d (the request carries one byte) unless --autoplay"
+                        % max_request_rounds)
+    p.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions are started")
+    p.add_argument("--think", type=float, default=0.0, help="mean think time before a decision, ms")
+    p.add_argument("--strategy", choices=sorted(strategies), default="stand")
+    p.add_argument("--autoplay", type=int, default=None, metavar="N",
+                   help="autoplay sessions: the server plays every round, standing on N (replaces --strategy)")
+    p.add_argument("--server", default="threaded",
+                   help="server to start, mode or mode:N workers (ignored with --port)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=None, help="use a running server instead of starting one")
+    p.add_argument("--timeout", type=float, default=300.0, help="seconds before unfinished sessions count as errors")
+    p.add_argument("--label", default=None, help="name stored with the run (default: the server)")
+    p.add_argument("--results", default=default_results, help="jsonl file the runs are appended to")
+    p.add_argument("--compare", action="store_true", help="print the stored runs and exit")
+    args = p.parse_args()
+    if args.autoplay is None and not 0 <= args.rounds <= max_request_rounds:
+        p.error(f"--rounds must be 0-{max_request_rounds} for interactive sessions "
+                "(pack_request clamps larger counts), use --autoplay for longer sessions")
+
+    if args.compare:
+        print_results(load_results(args.results))
+        return
+
+    limit = raise_fd_limit()
+    if args.sessions * 2 + 64 > limit:
+        print(f"warning: fd limit is {limit}, {args.sessions} local sessions need ~{args.sessions * 2}")
+
+    proc = None
+    port = args.port
+    if port is None:
+        mode, _, workers = args.server.partition(":")
+        proc, port = start_server(["--mode", mode] + (["--workers", workers] if workers else []))
+    try:
+        stats, elapsed = asyncio.run(generate(args.host, port, args.sessions, args.rounds, args.ramp,
+                                              args.think / 1000, strategies[args.strategy], args.timeout,
+                                              args.autoplay))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    record = {
+        "when": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "label": args.label or (f"{args.host}:{port}" if args.port else args.server),
+        "sessions": args.sessions,
+        "rounds": args.rounds,
+        "strategy": args.strategy if args.autoplay is None else f"auto{args.autoplay}",
+        "ramp_s": args.ramp,
+        "think_ms": args.think,
+        "completed_sessions": stats.sessions,
+        "completed_rounds": stats.rounds,
+        "errors": stats.errors,
+        "elapsed_s": round(elapsed, 3),
+        "rounds_per_sec": round(stats.rounds / elapsed, 1) if elapsed else 0.0,
+        "connect_ms": percentiles(stats.connect),
+        "latency_ms": percentiles(stats.latency),
+    }
+    previous = load_results(args.results)
+    save_result(args.results, record)
+    print_results([r for r in previous if r["label"] == record["label"]][-3:] + [record])
+    print(f"{stats.sessions}/{args.sessions} sessions, {stats.rounds} rounds in {elapsed:.1f}s, "
+          f"saved to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
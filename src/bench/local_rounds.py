@@ -0,0 +1,28 @@
+"""Plays rounds through game_engine.round_steps without any sockets.
+
+Used by the in-process benchmarks to time the server's per-round work on its
+own. The player hits once and then stands (unless that hit busts), so every
+round exercises the deal, a hit and usually the dealer turn.
+"""
+from common.protocol import pack_client_payload
+from server.game_engine import round_steps
+
+hit = pack_client_payload(b"Hittt")
+stand = pack_client_payload(b"Stand")
+
+
+def play_local_round(cards, slog):
+    # returns (result, number of server payloads produced)
+    steps = round_steps(cards, slog)
+    decisions = iter((hit, stand))
+    sent = 0
+    try:
+        out = next(steps)
+        while True:
+            if out is None:
+                out = steps.send(next(decisions))
+            else:
+                sent += 1
+                out = next(steps)
+    except StopIteration as stop:
+        return stop.value, sent
@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+from common.constants import udp_offer_port, offer_len
+from common.protocol import unpack_offer, unpack_load
+
+# background server discovery for the client. one thread owns the udp
+# socket for the whole client run: it drains every offer / load packet as
+# it arrives and keeps a table of live servers. servers that stop offering
+# drop out after ttl seconds. the table outlives each session, so going
+# back to discovery after a game finds it already filled.
+
+default_ttl = 3.5  # seconds without an offer before a server is dropped (offers come every second)
+
+
+class server_entry:
+    def __init__(self, name, now):
+        self.name = name
+        self.first_seen = now
+        self.last_seen = now
+        self.offers = 1
+        self.interval = None   # smoothed seconds between offers
+        self.load = None       # (active, queued, capacity) from load packets
+
+    def rate(self) -> float:
+        # offers per second
+        return 1.0 / self.interval if self.interval else 0.0
+
+
+class discovery:
+    def __init__(self, ttl=default_ttl, port=udp_offer_port):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.servers = {}      # (ip, tcp_port) -> server_entry
+        self.started = time.monotonic()
+        self.stopped = False
+
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # allow multiple clients to listen on the same machine
+        self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.s.bind(("", port))
+        self.s.settimeout(0.5)
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                data, addr = self.s.recvfrom(offer_len)
+            except socket.timeout:
+                self._expire()
+                continue
+            except OSError:
+                if self.stopped:
+                    return
+                time.sleep(0.1)
+                continue
+            self._handle(data, addr[0], time.monotonic())
+
+    def _handle(self, data, ip, now):
+        parsed = unpack_offer(data)
+        if parsed is not None:
+            tcp_port, name = parsed
+            key = (ip, tcp_port)
+            with self.lock:
+                e = self.servers.get(key)
+                if e is None or now - e.last_seen > self.ttl:
+                    self.servers[key] = server_entry(name, now)
+                    return
+                dt = now - e.last_seen
+                e.interval = dt if e.interval is None else 0.8 * e.interval + 0.2 * dt
+                e.last_seen = now
+                e.offers += 1
+                e.name = name
+            return
+        load = unpack_load(data)
+        if load is not None:
+            with self.lock:
+                e = self.servers.get((ip, load[0]))
+                if e is not None:
+                    e.load = load[1:]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        with self.lock:
+            for key in [k for k, e in self.servers.items() if e.last_seen < cutoff]:
+                del self.servers[key]
+
+    def live(self):
+        # [((ip, tcp_port), server_entry)] heard from within the ttl, oldest first
+        self._expire()
+        with self.lock:
+            return sorted(self.servers.items(), key=lambda item: item[1].first_seen)
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started
+
+    def close(self):
+        self.stopped = True
+        self.s.close()
+        self.thread.join()
+
+
+_discovery = None
+
+
+def start_discovery(ttl=default_ttl):
+    # one listener per client process, started on first use
+    global _discovery
+    if _discovery is None:
+        _discovery = discovery(ttl)
+    return _discovery
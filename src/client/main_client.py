@@ -1,10 +1,30 @@
+import os
 from client.udp_listener import listen_for_offer
-from client.tcp_client import play_session
+from client.tcp_client import play_session, autoplay_session
 from client.ui import ask_rounds, ask_name
 
+# AUTOPLAY=17 lets the server play every round (hit below 17, then stand)
+# and only shows the results, for bots and load tests
+autoplay = os.environ.get("AUTOPLAY")
+min_stand_on, max_stand_on = 2, 21
+
+
+def autoplay_stand_on():
+    # AUTOPLAY as the total to stand on, None if unset. exits on a bad value
+    if not autoplay:
+        return None
+    try:
+        stand_on = int(autoplay)
+    except ValueError:
+        stand_on = None
+    if stand_on is None or not min_stand_on <= stand_on <= max_stand_on:
+        raise SystemExit(f"AUTOPLAY must be a total to stand on, {min_stand_on}-{max_stand_on} (got {autoplay!r})")
+    return stand_on
+
 
 def main():
     print("--- Client Started ---")
+    stand_on = autoplay_stand_on()
 
     try:
         # get user info
@@ -23,7 +43,10 @@ def main():
 
             #here we create the tcp socket
             #blocking call, meaning it doesn't return till session end or interrupt
-            play_session(server_ip, server_port, rounds, team_name) # connect and play
+            if stand_on is not None:
+                autoplay_session(server_ip, server_port, rounds, stand_on, team_name)
+            else:
+                play_session(server_ip, server_port, rounds, team_name) # connect and play
 
             print("Game over. Searching for new server...\n") # after game finishes, loop back to listening
 
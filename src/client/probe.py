@@ -0,0 +1,54 @@
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# tcp connect rtt to the discovered servers. every connect is a full
+# syn / syn-ack round trip, the same trip each hit pays, so it is a fair
+# stand-in for how snappy a server will feel. all servers and all tries are
+# probed at once on a thread pool, so probing takes about one slowest rtt
+# per try, not the sum.
+#
+# a probe connects and closes without a request, the server logs it as a
+# connection that left before the handshake.
+
+default_tries = 3
+default_timeout = 1.0
+
+
+def connect_rtt(ip, port, timeout=default_timeout):
+    # seconds for one tcp connect, None if it failed or timed out
+    start = time.perf_counter()
+    try:
+        s = socket.create_connection((ip, port), timeout=timeout)
+    except OSError:
+        return None
+    rtt = time.perf_counter() - start
+    s.close()
+    return rtt
+
+
+def probe(keys, tries=default_tries, timeout=default_timeout):
+    # {(ip, port): median connect rtt in seconds, None if no try connected}
+    keys = list(keys)
+    if not keys:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(64, len(keys) * tries)) as pool:
+        futures = {key: [pool.submit(connect_rtt, key[0], key[1], timeout) for _ in range(tries)]
+                   for key in keys}
+        out = {}
+        for key, fs in futures.items():
+            rtts = [r for r in (f.result() for f in fs) if r is not None]
+            out[key] = statistics.median(rtts) if rtts else None
+    return out
+
+
+def rank(rtts):
+    # keys fastest first, unreachable servers left out
+    return sorted((k for k, r in rtts.items() if r is not None), key=lambda k: rtts[k])
+
+
+def format_rtt(rtt):
+    if rtt is None:
+        return "unreachable"
+    return f"rtt {rtt * 1000:.2f} ms"
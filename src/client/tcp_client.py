@@ -1,9 +1,14 @@
+import collections
+import os
 import socket
-from common.constants import server_payload_len
-from common.protocol import pack_request, pack_client_payload, unpack_server_payload
-from common.net_utils import recv_exact
-from common.cards import decode_card, rank_value
-from client.ui import ask_hit_or_stand
+import time
+from common.constants import server_payload_len, results_header_len
+from common.protocol import pack_request, pack_client_payload, pack_autoplay_request, unpack_results_header
+from common.net_utils import frame_reader
+from common.protocol_v2 import pack_hello, unpack_welcome, kind_welcome, client_reader, decision_socket
+from common.cards import hand, card_code
+from common.frames import decode_server_frame
+from client.ui import ask_moves
 
 # result codes from assignment
 RES_NOT_OVER = 0x0
@@ -11,6 +16,13 @@ RES_TIE = 0x1
 RES_LOSS = 0x2
 RES_WIN = 0x3
 
+# SHOW_ADVICE=1 prints the best move (from analysis/odds_6d.json) before each decision
+show_advice = os.environ.get("SHOW_ADVICE") == "1"
+
+# PROTOCOL=2 asks the server for protocol v2 (length-prefixed frames, see
+# common/protocol_v2.py), falling back to v1 if the server does not know it
+protocol = os.environ.get("PROTOCOL", "1")
+
 
 def _card_pretty(rank, suit):
     # rank is 1-13 (ace to king), suit is 0-3
@@ -28,10 +40,6 @@ def _card_pretty(rank, suit):
     return f"{r}{s}"
 
 
-def _hand_total(cards):
-    return sum(rank_value(r) for (r, _s) in cards)
-
-
 def _banner(text):
     line = "~" * (len(text) + 15)
     print(f"\n{line}\n~~~~~~ {text} ~~~~~~~\n{line}")
@@ -42,23 +50,54 @@ def _say(text):
     print(f"------ {text} ------ ")
 
 
+def _connect(ip, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(600)  # safety timeout
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # decisions go out right away
+    sock.connect((ip, port))
+    return sock
+
+
+def _hello(sock, rounds, name):
+    # asks for v2, returns (reader, conn) like play_session's v1 ones, or
+    # None if the server only speaks v1 (it closes on the unknown request)
+    sock.sendall(pack_hello(rounds, name))
+    reader = client_reader(sock)
+    try:
+        kind, body = reader.next_other()
+    except OSError:
+        return None
+    welcome = unpack_welcome(body) if kind == kind_welcome else None
+    if welcome is None:
+        raise ConnectionError("bad welcome frame")
+    _say(f"protocol v{welcome[0]}, session {welcome[1]}")
+    return reader, decision_socket(sock)
+
+
 def play_session(ip, port, rounds, name):
     _banner(f"connecting to dealer @ {ip}:{port}")
 
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(600)  # safety timeout
-        sock.connect((ip, port))
-
-        # sends request packet (name + rounds)
-        req_packet = pack_request(rounds, name)
-        sock.sendall(req_packet)
+        sock = _connect(ip, port)
+        opened = _hello(sock, rounds, name) if protocol == "2" else None
+        if opened is None and protocol == "2":
+            _say("server only speaks v1, reconnecting")
+            sock.close()
+            sock = _connect(ip, port)
+
+        if opened is None:
+            # sends request packet (name + rounds)
+            req_packet = pack_request(rounds, name)
+            sock.sendall(req_packet)
+            reader, conn = frame_reader(sock), sock
+        else:
+            reader, conn = opened
 
         wins = 0
 
         for i in range(rounds):
             _banner(f"round {i + 1} / {rounds}")
-            result = play_one_round(sock)
+            result = play_one_round(conn, reader)
 
             if result == RES_WIN:
                 _say(" you win this round!")
@@ -78,89 +117,145 @@ def play_session(ip, port, rounds, name):
         print(f"Connection Error: {e}")
 
 
-def play_one_round(sock): # handles the flow of a single round
+def autoplay_session(ip, port, rounds, stand_on, name):
+    # bot mode: the server plays every round itself (hit below stand_on, then
+    # stand) and streams back one result byte per round
+    _banner(f"autoplay @ {ip}:{port}, stand on {stand_on}")
 
-    # phase 1: initial Deal (3 cards)
-    # server sends: player card 1 , player card 2 , dealer up card
-    print(".............shuffling.............")
-    player_cards = []
-    dealer_cards = []
     try:
-        for i in range(3):
-            data = recv_exact(sock, server_payload_len)
-            res, card_bytes = unpack_server_payload(data)
-
-            rank, suit = decode_card(card_bytes)
+        sock = socket.create_connection((ip, port))
+        sock.settimeout(600)  # safety timeout
+        start = time.perf_counter()
+        sock.sendall(pack_autoplay_request(rounds, stand_on, name))
+
+        reader = frame_reader(sock, 65536)
+        counts = collections.Counter()
+        done = 0
+        while done < rounds:
+            n = unpack_results_header(reader.read(results_header_len))
+            if n is None:
+                raise ConnectionError("bad results frame")
+            counts.update(reader.read(n))  # counted straight from the receive buffer
+            done += n
+        elapsed = time.perf_counter() - start
+        sock.close()
 
-            if i == 2:
-                dealer_cards.append((rank, suit))
-                _say(f"dealer shows: {_card_pretty(rank, suit)} (total: {_hand_total(dealer_cards)})")
-            else:
-                player_cards.append((rank, suit))
-                _say(f"you get: {_card_pretty(rank, suit)}")
+        _banner("session summary")
+        _say(f"{rounds} rounds in {elapsed:.2f}s ({rounds / elapsed:.0f} rounds/s)")
+        _say(f"wins {counts[RES_WIN]}, losses {counts[RES_LOSS]}, ties {counts[RES_TIE]}")
+        _say(f"win rate: {counts[RES_WIN] / rounds:.1%}" if rounds else "win rate: -")
 
-            # after the second player card, show your starting hand + total
-            if i == 1:
-                pretty = " ".join(_card_pretty(r, s) for (r, s) in player_cards)
-                _say(f"your hand: {pretty}  (total: {_hand_total(player_cards)})")
     except Exception as e:
-        print(f"Error getting initial cards: {e}")
-        return RES_LOSS
+        print(f"Connection Error: {e}")
 
 
-    # phase 2: player decisions
-    while True:
-        move = ask_hit_or_stand()
+def _advice(player_hand, dealer_hand):
+    from analysis.odds import advise
+    move, ev_hit, ev_stand = advise(player_hand.total(), player_hand.is_soft(), dealer_hand.total())
+    return f"------ advice: {move} (ev hit {ev_hit:+.3f}, stand {ev_stand:+.3f}) ------ "
 
-        if move == "hit":
-            sock.sendall(pack_client_payload(b"Hittt"))
 
-            data = recv_exact(sock, server_payload_len)
-            res, card_bytes = unpack_server_payload(data)
+def play_moves(reader, moves, player_cards, player_hand):
+    # reads the server's answers to moves that were already sent.
+    # returns None after a stand, else the result of the last card read
+    res = RES_NOT_OVER
+    for n, move in enumerate(moves):
+        if move == "hit":
+            res, rank, suit = decode_server_frame(bytes(reader.read(server_payload_len)))
 
             # always print the card if it exists, even if we busted
-            if card_bytes != b'\x00\x00\x00':
-                rank, suit = decode_card(card_bytes)
+            if rank != 0:
                 player_cards.append((rank, suit))
+                player_hand.add(card_code(rank, suit))
                 pretty = " ".join(_card_pretty(r, s) for (r, s) in player_cards)
                 _say(f"hit! you draw: {_card_pretty(rank, suit)}")
-                _say(f"your hand: {pretty}  (total: {_hand_total(player_cards)})")
+                _say(f"your hand: {pretty}  (total: {player_hand.total()})")
 
             if res == RES_LOSS:
                 _say(" bust! you went over 21")
 
             if res != RES_NOT_OVER:
+                if n + 1 < len(moves):
+                    _say(f"the other {len(moves) - n - 1} planned moves were dropped")
                 return res  # game over (bust)
 
         else:
-            # send 'Stand' (5 bytes)
-            sock.sendall(pack_client_payload(b"Stand"))
             pretty = " ".join(_card_pretty(r, s) for (r, s) in player_cards)
-            _say(f"stand. you lock: {pretty}  (total: {_hand_total(player_cards)})")
+            _say(f"stand. you lock: {pretty}  (total: {player_hand.total()})")
             _say("dealer's turn...")
-            break
+            return None
+    return res
+
+
+def play_one_round(sock, reader): # handles the flow of a single round
+
+    # phase 1: initial Deal (3 cards)
+    # server sends: player card 1 , player card 2 , dealer up card
+    print(".............shuffling.............")
+    player_cards = []
+    dealer_cards = []
+    # running totals (soft aces included), updated as cards arrive
+    player_hand = hand()
+    dealer_hand = hand()
+    try:
+        # the deal usually comes in one recv, take the three frames together
+        deal = []
+        while len(deal) < 3:
+            deal += [decode_server_frame(bytes(f)) for f in reader.read_frames(server_payload_len, 3 - len(deal))]
+        for i, (res, rank, suit) in enumerate(deal):
+
+            if i == 2:
+                dealer_cards.append((rank, suit))
+                dealer_hand.add(card_code(rank, suit))
+                _say(f"dealer shows: {_card_pretty(rank, suit)} (total: {dealer_hand.total()})")
+            else:
+                player_cards.append((rank, suit))
+                player_hand.add(card_code(rank, suit))
+                _say(f"you get: {_card_pretty(rank, suit)}")
+
+            # after the second player card, show your starting hand + total
+            if i == 1:
+                pretty = " ".join(_card_pretty(r, s) for (r, s) in player_cards)
+                _say(f"your hand: {pretty}  (total: {player_hand.total()})")
+    except Exception as e:
+        print(f"Error getting initial cards: {e}")
+        return RES_LOSS
+
+
+    # phase 2: player decisions
+    # a plan of several moves is sent ahead in one write (pipelining). the
+    # server stops at a bust and drops the rest, so it has to be one write:
+    # anything still in flight when the round ends would count for the next
+    while True:
+        moves = ask_moves(_advice(player_hand, dealer_hand) if show_advice else None)
+        if "stand" in moves:
+            moves = moves[:moves.index("stand") + 1]
+        sock.sendall(b"".join(pack_client_payload(b"Hittt" if m == "hit" else b"Stand") for m in moves))
+        res = play_moves(reader, moves, player_cards, player_hand)
+        if res is None:
+            break  # stood
+        if res != RES_NOT_OVER:
+            return res  # game over (bust)
 
     # phase 3: dealer turn & results
     # we must listen repeatedly until the server sends a final result (WIN/LOSS/TIE)
     while True:
-        data = recv_exact(sock, server_payload_len)
-        res, card_bytes = unpack_server_payload(data)
+        res, rank, suit = decode_server_frame(bytes(reader.read(server_payload_len)))
 
         # if there is a valid card in this packet, show it (dealer drawing)
-        if card_bytes != b'\x00\x00\x00':
-            rank, suit = decode_card(card_bytes)
-            # only print if it looks like a real card and not (0,0)
-            if rank != 0:
-                dealer_cards.append((rank, suit))
-                pretty = " ".join(_card_pretty(r, s) for (r, s) in dealer_cards)
-                _say(f"dealer draws: {_card_pretty(rank, suit)}")
-                _say(f"dealer hand: {pretty}  (total: {_hand_total(dealer_cards)})")
+        # only print if it looks like a real card and not (0,0)
+        if rank != 0:
+            dealer_cards.append((rank, suit))
+            dealer_hand.add(card_code(rank, suit))
+            pretty = " ".join(_card_pretty(r, s) for (r, s) in dealer_cards)
+            _say(f"dealer draws: {_card_pretty(rank, suit)}")
+            _say(f"dealer hand: {pretty}  (total: {dealer_hand.total()})")
 
         # if result is not 0, the round is over
         if res != RES_NOT_OVER:
             _banner("round summary")
             p_pretty = " ".join(_card_pretty(r, s) for (r, s) in player_cards)
             d_pretty = " ".join(_card_pretty(r, s) for (r, s) in dealer_cards)
-            _say(f"you:    {p_pretty}  (total: {_hand_total(player_cards)})")
-            _say(f"dealer: {d_pretty}  (total: {_hand_total(dealer_cards)})")
+            _say(f"you:    {p_pretty}  (total: {player_hand.total()})")
+            _say(f"dealer: {d_pretty}  (total: {dealer_hand.total()})")
             return res
\ No newline at end of file
@@ -1,94 +1,152 @@
-import socket
-from common.constants import udp_offer_port, offer_len
-#expected offer_len = magic(4) + type(1) + tcp_port(2) + server_name(32)
-from common.protocol import unpack_offer
+import os
+import time
+from client.discovery import start_discovery
+from client.probe import probe, rank, format_rtt
 
 """
-Listens for UDP offers and lets the user choose which server to connect to.
+Lets the user choose which discovered server to connect to.
+
+The UDP socket itself is owned by client.discovery: a background thread
+that keeps draining offers and load packets for the whole client run, so
+the list below is always current and old servers drop out on their own.
 
 Behavior:
-- keeps listening and printing discovered servers (deduped by ip+port)
-- press ENTER to keep listening for more offers
+- prints the live servers (deduped by ip+port) with their load and offer rate
+- press ENTER to refresh the list
 - type a number to select a server from the list
+- type 'a' to pick the least loaded server heard from
+- type 'p' to measure the tcp connect rtt of every listed server
+- type 'f' to measure and pick the fastest one
 - type 'q' to quit selection (returns None)
+- with AUTO_PICK=1 no menu is shown: once the listener has run for a few
+  seconds it picks the least loaded server by itself (AUTO_PICK=fastest
+  picks the lowest rtt instead)
 
 Returns:
 - (server_ip, tcp_port, server_name) when user selects one
 - None if user quits or no valid servers were found
 """
 
-def listen_for_offer():
-    # create UDP socket (IPv4 + UDP)
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+auto_pick = {"1": "load", "load": "load", "fastest": "fastest"}.get(os.environ.get("AUTO_PICK", ""))
+auto_pick_wait = 3.0  # seconds of offers to collect before auto picking
+
+
+def load_key(load):
+    # sort key, lower = less loaded. servers that sent no load info go last
+    if load is None:
+        return (1, 0.0, 0)
+    active, queued, capacity = load
+    return (0, (active + queued) / max(capacity, 1), active)
+
+
+def least_loaded(servers):
+    # (ip, port, name) of the least loaded of [((ip, port), server_entry)], None if empty
+    if not servers:
+        return None
+    (ip, port), e = min(servers, key=lambda item: load_key(item[1].load))
+    return ip, port, e.name
+
+
+def fastest(servers, rtts):
+    # (ip, port, name) with the lowest rtt, ties to the less loaded. None if none answered
+    entries = dict(servers)
+    ranked = sorted(rank(rtts), key=lambda k: (rtts[k], load_key(entries[k].load)))
+    if not ranked:
+        return None
+    ip, port = ranked[0]
+    return ip, port, entries[ranked[0]].name
 
-    # map: (ip, tcp_port) -> server_name
-    seen = {}
 
-    try:
-        # allow multiple clients to listen on the same machine
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if hasattr(socket, "SO_REUSEPORT"):
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+def print_rtts(servers, rtts):
+    print("\nconnect rtt, fastest first:")
+    entries = dict(servers)
+    for ip, port in rank(rtts):
+        print(f"  {entries[(ip, port)].name} @ {ip}:{port}  {format_rtt(rtts[(ip, port)])}")
+    for key in entries:
+        if key in rtts and rtts[key] is None:
+            print(f"  {entries[key].name} @ {key[0]}:{key[1]}  unreachable")
 
-        # listen on all interfaces on the offer port
-        s.bind(("", udp_offer_port))
 
-        print("listening for server offers... (press enter to refresh list, number to pick, q to quit)")
+def format_load(load):
+    if load is None:
+        return "load unknown"
+    active, queued, capacity = load
+    return f"load {active}/{capacity}" + (f" +{queued} queued" if queued else "")
 
+
+def listen_for_offer():
+    d = start_discovery()
+    rtts = {}  # (ip, port) -> rtt of the last probe
+
+    if auto_pick:
+        print(f"waiting for server offers, then picking the {'fastest' if auto_pick == 'fastest' else 'least loaded'}...")
         while True:
-            # short timeout so we can keep printing / accepting user choices
-            s.settimeout(1.0)
-
-            try:
-                data, addr = s.recvfrom(offer_len)
-            except socket.timeout:
-                data = None
-            except Exception as e:
-                print(f"udp error: {e}")
-                data = None
-
-            # if we received something, try to parse it as an offer
-            if data is not None:
-                parsed = unpack_offer(data)
-                if parsed is not None:
-                    tcp_port, server_name = parsed
-                    server_ip = addr[0]
-
-                    key = (server_ip, tcp_port)
-                    # store newest name we saw for this ip+port
-                    if key not in seen:
-                        print(f"found server: name='{server_name}' ip={server_ip} tcp_port={tcp_port}")
-                    seen[key] = server_name
-
-            # show menu prompt every loop, so user can pick at any time
-            if seen:
-                print("\nservers discovered:")
-                items = list(seen.items())
-                for idx, ((ip, port), name) in enumerate(items, start=1):
-                    print(f"  {idx}) {name} @ {ip}:{port}")
-            else:
-                print("\n(no servers discovered yet)")
-
-            choice = input("choose server (enter=keep listening, number=select, q=quit): ").strip().lower()
-            if choice == "":
-                # keep listening
+            servers = d.live()
+            if servers and d.uptime() >= auto_pick_wait:
+                if auto_pick == "fastest":
+                    rtts = probe(k for k, _ in servers)
+                    pick = fastest(servers, rtts)
+                else:
+                    pick = least_loaded(servers)
+                if pick is not None:
+                    ip, port, _ = pick
+                    e = dict(servers)[(ip, port)]
+                    print(f"picked '{e.name}' @ {ip}:{port} ({format_load(e.load)}"
+                          + (f", {format_rtt(rtts[(ip, port)])})" if rtts else ")"))
+                    return pick
+            time.sleep(0.2)
+
+    print("listening for server offers... (press enter to refresh list, number to pick, a = least loaded, "
+          "p = probe rtt, f = fastest, q to quit)")
+    while True:
+        servers = d.live()
+
+        # show menu prompt every loop, so user can pick at any time
+        if servers:
+            print("\nservers discovered:")
+            for idx, ((ip, port), e) in enumerate(servers, start=1):
+                rtt = f"  {format_rtt(rtts[(ip, port)])}" if (ip, port) in rtts else ""
+                print(f"  {idx}) {e.name} @ {ip}:{port}  {format_load(e.load)}{rtt}  "
+                      f"{e.rate():.1f} offers/s, seen {time.monotonic() - e.last_seen:.1f}s ago")
+        else:
+            print("\n(no servers discovered yet)")
+
+        choice = input("choose server (enter=keep listening, number=select, a=least loaded, "
+                       "p=probe, f=fastest, q=quit): ").strip().lower()
+        if choice == "":
+            # keep listening
+            continue
+        if choice == "q":
+            return None
+        if choice == "a":
+            if not servers:
+                print("no servers yet.")
                 continue
-            if choice == "q":
-                return None
-
-            # try parse number
-            try:
-                n = int(choice)
-            except ValueError:
-                print("invalid input. type a number, enter, or q.")
+            return least_loaded(servers)
+        if choice in ("p", "f"):
+            if not servers:
+                print("no servers yet.")
                 continue
-
-            items = list(seen.items())
-            if 1 <= n <= len(items):
-                (ip, port), name = items[n - 1]
-                return ip, port, name
-            else:
-                print("number out of range.")
-
-    finally:
-        s.close()
\ No newline at end of file
+            rtts = probe(k for k, _ in servers)
+            print_rtts(servers, rtts)
+            if choice == "p":
+                continue
+            pick = fastest(servers, rtts)
+            if pick is None:
+                print("no server answered.")
+                continue
+            return pick
+
+        # try parse number
+        try:
+            n = int(choice)
+        except ValueError:
+            print("invalid input. type a number, enter, or q.")
+            continue
+
+        # pick from the list that was shown, even if it has changed since
+        if 1 <= n <= len(servers):
+            (ip, port), e = servers[n - 1]
+            return ip, port, e.name
+        else:
+            print("number out of range.")
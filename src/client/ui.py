@@ -19,12 +19,18 @@ def ask_name():
     return name
 
 
-# loops until user enters 'hit' or 'stand'
-def ask_hit_or_stand():
+# loops until user enters 'hit', 'stand' (or the start of one, "h", "st")
+# or a plan of several moves in one go: "hhs" = hit, hit, stand. the plan goes to the server in one write, so
+# the hits cost one round trip instead of one each. advice, if given, is
+# printed above the prompt. returns a list of moves
+def ask_moves(advice=None):
+    if advice:
+        print(advice)
     while True:
-        choice = input("\nYour move? (Hit/Stand): ").strip().lower()
-        if choice.startswith('h'):
-            return "hit"
-        if choice.startswith('s'):
-            return "stand"
-        print("Invalid move. Please type 'hit' or 'stand'.")
\ No newline at end of file
+        choice = input("\nYour move? (Hit/Stand, or a plan like 'hhs'): ").strip().lower()
+        for move in ("hit", "stand"):
+            if choice and move.startswith(choice):
+                return [move]
+        if choice and all(c in "hs " for c in choice):
+            return ["hit" if c == "h" else "stand" for c in choice if c != " "]
+        print("Invalid move. Please type 'hit', 'stand' or a plan of h / s letters.")
\ No newline at end of file
@@ -1,4 +1,5 @@
 import random
+from array import array
 
 suits = [0, 1, 2, 3] # suits encoding: 0-3
 
@@ -23,38 +24,78 @@ def decode_card(card3: bytes):
     return rank, suit
 
 
+# every card has a code 0-51 (suit * 13 + rank - 1), handy as a table index
+def card_code(rank: int, suit: int) -> int:
+    return suit * 13 + rank - 1
+
+
+# (rank, suit) of every card code
+card_of_code = tuple((rank, suit) for suit in suits for rank in range(1, 14))
+
+
 def suit_name(suit: int) -> str:
     return ["Hearts", "Diamonds", "Clubs", "Spades"][suit]
 
 
-class deck:
-    #init deck with suffered cards [1-13(rank) ,0-3(suit)]
-    def __init__(self):
-        self.cards = []
-        for suit in suits:
-            for rank in range(1, 14):
-                self.cards.append((rank, suit))
-        random.shuffle(self.cards)
+class shoe:
+    # one or more decks kept as card codes (0-51) in a byte array, dealt by
+    # moving a cursor instead of popping from a list. it lives for a whole
+    # session; a cut card at `penetration` of the way in marks the reshuffle
+    # point, checked between rounds by start_round()
+    def __init__(self, decks: int = 6, penetration: float = 0.75, rng=None):
+        self.rng = rng or random
+        self.cards = array("B", range(52)) * max(1, decks)
+        self.cut = max(1, min(len(self.cards), int(len(self.cards) * penetration)))
+        self.shuffle()
+
+    def shuffle(self):
+        self.rng.shuffle(self.cards)
+        self.pos = 0
 
-    def draw(self):
-        if not self.cards:
-            # reshuffle if empty
-            self.__init__()
-        return self.cards.pop()
+    def start_round(self):
+        # reshuffle once the cut card has come out
+        if self.pos >= self.cut:
+            self.shuffle()
+
+    def draw(self) -> int:
+        if self.pos >= len(self.cards):
+            # ran dry mid round (tiny shoe / deep penetration)
+            self.shuffle()
+        c = self.cards[self.pos]
+        self.pos += 1
+        return c
+
+
+# value of every card code with aces as 1 (the hand adds the extra 10)
+hard_value_of_code = bytes(min(rank, 10) for rank, _ in card_of_code)
 
 
 class hand:
+    # cards are codes 0-51. the totals are kept up to date on add(), so
+    # total() / is_bust() / is_soft() are O(1) however often they are asked.
+    # aces count 1 in `hard`; one ace counts 11 when that keeps the hand at
+    # 21 or less, which makes the hand "soft".
+    __slots__ = ("cards", "hard", "aces", "best")
+
     def __init__(self):
-        self.items = []
+        self.cards = bytearray()
+        self.hard = 0
+        self.aces = 0
+        self.best = 0
 
-    def add(self, card):
-        self.items.append(card)
+    def add(self, code: int):
+        self.cards.append(code)
+        v = hard_value_of_code[code]
+        self.hard += v
+        if v == 1:
+            self.aces += 1
+        self.best = self.hard + 10 if self.aces and self.hard <= 11 else self.hard
 
     def total(self) -> int:
-        s = 0
-        for r, _ in self.items:
-            s += rank_value(r)
-        return s
+        return self.best
+
+    def is_soft(self) -> bool:
+        return self.best != self.hard
 
     def is_bust(self) -> bool:
-        return self.total() > 21
\ No newline at end of file
+        return self.hard > 21
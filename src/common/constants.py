@@ -4,6 +4,10 @@ magic_cookie = 0xabcddcba
 msg_type_offer = 0x2
 msg_type_request = 0x3
 msg_type_payload = 0x4
+msg_type_load = 0x5
+msg_type_autoplay = 0x6
+msg_type_results = 0x7
+msg_type_request_v2 = 0x8
 
 # udp port used for offers
 udp_offer_port = 13122
@@ -16,9 +20,27 @@ card_len = 3
 # offer packet: magic (4) + type (1) + udp_port (2) + server_name (32)
 offer_len = 4 + 1 + 2 + name_len
 
+# load packet, sent right after every offer (shorter than an offer, so
+# clients that only know offers drop it as invalid):
+# magic (4) + type (1) + tcp_port (2) + active (4) + queued (4) + capacity (4)
+load_len = 4 + 1 + 2 + 4 + 4 + 4
+
 # request packet: magic (4) + type (1) + tcp_port (1) + client_name (32)
 request_len = 4 + 1 + 1 + name_len
 
+# autoplay request (instead of a request, the server plays every round itself):
+# magic (4) + type (1) + rounds (4) + stand_on (1) + client_name (32)
+autoplay_request_len = 4 + 1 + 4 + 1 + name_len
+
+# autoplay results, server -> client, one per batch of rounds:
+# magic (4) + type (1) + count (2), then count result codes (1 byte each)
+results_header_len = 4 + 1 + 2
+results_batch = 4096
+
+# v2 request (hello), asks for protocol v2 (see protocol_v2.py):
+# magic (4) + type (1) + version (1) + rounds (4) + client_name (32)
+request_v2_len = 4 + 1 + 1 + 4 + name_len
+
 # client -> server payload:
 # magic (4) + type (1) + decision (5) = 10 bytes
 client_payload_len = 4 + 1 + decision_len
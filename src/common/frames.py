@@ -0,0 +1,33 @@
+from types import MappingProxyType
+from .cards import card_of_code, encode_card, decode_card
+from .protocol import pack_server_payload, unpack_server_payload
+
+# there are only 52 cards x 4 result codes, so every server -> client payload
+# the engine can send is built once here and reused as is.
+
+# server_frames[result][card code] -> the 9-byte payload
+server_frames = tuple(
+    tuple(pack_server_payload(result, encode_card(rank, suit)) for rank, suit in card_of_code)
+    for result in range(4)
+)
+
+# reverse map for the client: 9-byte payload -> (result, rank, suit)
+frame_decode = MappingProxyType({
+    frame: (result, rank, suit)
+    for result, row in enumerate(server_frames)
+    for frame, (rank, suit) in zip(row, card_of_code)
+})
+
+
+def decode_server_frame(data: bytes):
+    # table lookup, falls back to the full parser for anything not in the
+    # table (e.g. the all-zero dummy card). returns None if invalid
+    hit = frame_decode.get(data)
+    if hit is not None:
+        return hit
+    parsed = unpack_server_payload(data)
+    if parsed is None:
+        return None
+    result, card3 = parsed
+    rank, suit = decode_card(card3)
+    return result, rank, suit
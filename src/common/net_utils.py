@@ -12,6 +12,108 @@ def recv_exact(sock: socket.socket, n: int) -> bytes:
         got += len(part)
     return b"".join(chunks)
 
+class frame_reader:
+    # per-connection replacement for recv_exact: recv_into one preallocated
+    # buffer and hand out memoryview slices of it, so a message costs no
+    # copies and one read can bring in several messages at once.
+    # a returned slice is only valid until the next call on the reader.
+    def __init__(self, sock: socket.socket, size: int = 4096):
+        self.sock = sock
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first unread byte
+        self.end = 0    # end of received data
+
+    def _fill(self, need: int) -> None:
+        # make sure `need` bytes fit after start, then do one recv
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.buf) - self.start < need:
+            # move the partial message to the front (rare, and only a few bytes)
+            pending = bytes(self.view[self.start:self.end])
+            self.buf[:len(pending)] = pending
+            self.start, self.end = 0, len(pending)
+        got = self.sock.recv_into(self.view[self.end:])
+        if got == 0:
+            raise ConnectionError("peer disconnected")
+        self.end += got
+
+    def read(self, n: int) -> memoryview:
+        # exactly n bytes, like recv_exact
+        while self.end - self.start < n:
+            self._fill(n)
+        frame = self.view[self.start:self.start + n]
+        self.start += n
+        return frame
+
+    def read_frames(self, n: int, most: int = 0) -> list:
+        # at least one n-byte frame, plus every complete one already buffered
+        # (at most `most` in all if given, so the next message stays put)
+        while self.end - self.start < n:
+            self._fill(n)
+        count = (self.end - self.start) // n
+        if most:
+            count = min(count, most)
+        first = self.start
+        self.start += count * n
+        return [self.view[i:i + n] for i in range(first, self.start, n)]
+
+    def read_some(self) -> bytes:
+        # whatever is buffered, or what one recv brings, b"" once the peer is
+        # gone. for framings that are not fixed-size (protocol v2)
+        if self.start == self.end:
+            self.start = 0
+            self.end = self.sock.recv_into(self.view)
+        data = bytes(self.view[self.start:self.end])
+        self.start = self.end
+        return data
+
+    def buffered(self) -> int:
+        return self.end - self.start
+
+    def drop_frames(self, n: int) -> int:
+        # throws away every complete n-byte frame already buffered, returns how many
+        count = (self.end - self.start) // n
+        self.start += count * n
+        return count
+
+
+def sendmsg_all(sock: socket.socket, parts) -> None:
+    # send several buffers with one scatter-gather syscall,
+    # looping only if the kernel took part of them
+    parts = list(parts)
+    if not hasattr(sock, "sendmsg"):
+        # no sendmsg (windows), join and send once instead
+        sock.sendall(b"".join(parts))
+        return
+    while parts:
+        sent = sock.sendmsg(parts)
+        # drop the buffers that went out completely, trim the partial one
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if parts and sent:
+            parts[0] = memoryview(parts[0])[sent:]
+
+
+class send_buffer:
+    # outgoing payloads of one connection. add() only queues, flush() writes
+    # everything queued since the last flush in one syscall. the server
+    # flushes right before it blocks on a read, so a round that produces
+    # several packets in a row costs one segment instead of one each.
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.parts = []
+
+    def add(self, data: bytes) -> None:
+        self.parts.append(data)
+
+    def flush(self) -> None:
+        if self.parts:
+            sendmsg_all(self.sock, self.parts)
+            self.parts = []
+
+
 def pad_name(s: str, length: int) -> bytes:
     # ascii name, trimmed and padded with zeros
     b = s.encode("ascii", errors="ignore")[:length]
@@ -1,7 +1,8 @@
 import struct
 from .constants import (
-    magic_cookie, msg_type_offer, msg_type_request, msg_type_payload,
-    name_len, decision_len, card_len)
+    magic_cookie, msg_type_offer, msg_type_request, msg_type_payload, msg_type_load,
+    msg_type_autoplay, msg_type_results, name_len, decision_len, card_len, load_len,
+    autoplay_request_len, results_header_len)
 
 from .net_utils import pad_name, read_name
 
@@ -20,6 +21,19 @@ def unpack_offer(data: bytes):
     name = read_name(data[7:7 + name_len])
     return tcp_port, name
 
+def pack_load(tcp_port: int, active: int, queued: int, capacity: int) -> bytes:
+    # cookie (4), type (1), port (2), active sessions (4), queued (4), session capacity (4)
+    return struct.pack("!IBHIII", magic_cookie, msg_type_load, tcp_port, active, queued, capacity)
+
+def unpack_load(data: bytes):
+    # returns (tcp_port, active, queued, capacity) or None if invalid
+    if len(data) != load_len:
+        return None
+    cookie, mtype, tcp_port, active, queued, capacity = struct.unpack("!IBHIII", data)
+    if cookie != magic_cookie or mtype != msg_type_load:
+        return None
+    return tcp_port, active, queued, capacity
+
 
 
 # TCP hand shake
@@ -38,6 +52,41 @@ def unpack_request(data: bytes):
     return rounds, name
 
 
+def pack_autoplay_request(rounds: int, stand_on: int, client_name: str) -> bytes:
+    # cookie (4), type (1), rounds (4), stand_on (1), name (32)
+    rounds = max(0, min(2 ** 32 - 1, int(rounds)))
+    stand_on = max(0, min(255, int(stand_on)))
+    return struct.pack("!IBIB", magic_cookie, msg_type_autoplay, rounds, stand_on) + pad_name(client_name, name_len)
+
+def is_autoplay(data: bytes) -> bool:
+    # looks at the first request_len bytes: the server reads that much
+    # either way and then the rest of an autoplay request
+    return len(data) > 4 and data[4] == msg_type_autoplay
+
+def unpack_autoplay_request(data: bytes):
+    # returns (rounds, name, stand_on) or None if invalid
+    if len(data) != autoplay_request_len:
+        return None
+    cookie, mtype, rounds, stand_on = struct.unpack("!IBIB", data[:10])
+    if cookie != magic_cookie or mtype != msg_type_autoplay:
+        return None
+    name = read_name(data[10:10 + name_len])
+    return rounds, name, stand_on
+
+def pack_results(codes: bytes) -> bytes:
+    # cookie (4), type (1), count (2), then one result code per round
+    return struct.pack("!IBH", magic_cookie, msg_type_results, len(codes)) + codes
+
+def unpack_results_header(data: bytes):
+    # returns how many result codes follow, or None if invalid
+    if len(data) != results_header_len:
+        return None
+    cookie, mtype, count = struct.unpack("!IBH", data)
+    if cookie != magic_cookie or mtype != msg_type_results:
+        return None
+    return count
+
+
 # TCP decision (payload)
 def pack_client_payload(decision5: bytes) -> bytes:
     # client -> server payload: cookie (4), type (1), decision(5)
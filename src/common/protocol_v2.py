@@ -0,0 +1,220 @@
+import collections
+import struct
+from .constants import magic_cookie, msg_type_request_v2, name_len, request_v2_len, client_payload_len, server_payload_len
+from .frames import server_frames, frame_decode
+from .net_utils import pad_name, read_name
+from .protocol import pack_client_payload
+
+# protocol v2, negotiated in the request: a client that wants it sends a
+# hello (type 0x8) instead of the v1 request, everything else keeps talking
+# v1. after the hello both sides exchange length-prefixed frames:
+#
+#     length (2)  bytes that follow
+#     kind   (1)
+#     body   (length - 1)
+#
+# no cookie per message and several cards per frame. kinds a side does not
+# know are skipped by their length, so new kinds can be added later.
+#
+#   welcome    server -> client, first frame: version (1), session id (8),
+#              then extensions as (tag (1), len (1), value) triples.
+#              the hello carries the newest version the client speaks,
+#              the welcome the one the server picked
+#   cards      server -> client: one byte per v1 payload, result << 6 | card
+#              code (0-51). the server sends everything it has before each
+#              wait as one frame, so a round is one or two frames
+#   decisions  client -> server: one letter per decision, b"H" or b"S".
+#              several in one frame are pipelined decisions
+#
+# the round code itself only ever sees v1 payloads: payload_reader turns
+# frames back into them, pack_cards / pack_decisions turn them into frames.
+
+version = 2
+
+frame_header = struct.Struct("!HB")
+frame_header_len = frame_header.size
+max_body = 0xFFFF - 1
+
+kind_welcome = 0x1
+kind_cards = 0x2
+kind_decisions = 0x3
+
+welcome_format = struct.Struct("!BQ")
+
+# welcome extensions
+ext_rounds = 0x1   # rounds the server will play (4)
+
+# card bytes <-> the v1 payloads they stand for
+card_byte = {frame: result << 6 | code
+             for result, row in enumerate(server_frames)
+             for code, frame in enumerate(row)}
+card_payload = [server_frames[b >> 6][b & 0x3F] if (b & 0x3F) < 52 else None for b in range(256)]
+# card byte -> (result, rank, suit), for readers that skip the v1 payloads
+card_decode = [frame_decode[p] if p is not None else None for p in card_payload]
+
+decision_letter = {pack_client_payload(b"Hittt"): b"H", pack_client_payload(b"Stand"): b"S"}
+letter_payload = {b"H"[0]: pack_client_payload(b"Hittt"), b"S"[0]: pack_client_payload(b"Stand")}
+
+
+def pack_hello(rounds: int, client_name: str, wanted: int = version) -> bytes:
+    # cookie (4), type (1), version (1), rounds (4), name (32)
+    rounds = max(0, min(2 ** 32 - 1, int(rounds)))
+    return struct.pack("!IBBI", magic_cookie, msg_type_request_v2, wanted, rounds) + pad_name(client_name, name_len)
+
+
+def is_hello(data: bytes) -> bool:
+    # looks at the first request_len bytes, like protocol.is_autoplay
+    return len(data) > 4 and data[4] == msg_type_request_v2
+
+
+def unpack_hello(data: bytes):
+    # returns (rounds, name) or None if invalid. every version from 2 up is
+    # accepted, the server answers with the one it speaks
+    if len(data) != request_v2_len:
+        return None
+    cookie, mtype, wanted, rounds = struct.unpack("!IBBI", data[:10])
+    if cookie != magic_cookie or mtype != msg_type_request_v2 or wanted < 2:
+        return None
+    return rounds, read_name(data[10:10 + name_len])
+
+
+def pack_frame(kind: int, body: bytes) -> bytes:
+    if len(body) > max_body:
+        raise ValueError("frame body too long")
+    return frame_header.pack(len(body) + 1, kind) + body
+
+
+def pack_welcome(session_id: int, extensions=None, agreed: int = version) -> bytes:
+    # extensions: {tag: bytes value}
+    body = welcome_format.pack(agreed, session_id)
+    for tag, value in (extensions or {}).items():
+        body += struct.pack("!BB", tag, len(value)) + value
+    return pack_frame(kind_welcome, body)
+
+
+def unpack_welcome(body: bytes):
+    # returns (version, session id, {tag: value}) or None if invalid
+    if len(body) < welcome_format.size:
+        return None
+    agreed, session_id = welcome_format.unpack_from(body)
+    extensions = {}
+    i = welcome_format.size
+    while i + 2 <= len(body):
+        tag, n = body[i], body[i + 1]
+        extensions[tag] = bytes(body[i + 2:i + 2 + n])
+        i += 2 + n
+    return agreed, session_id, extensions
+
+
+def pack_cards(payloads) -> bytes:
+    # v1 server payloads (from common.frames) -> one cards frame
+    body = bytes(map(card_byte.__getitem__, payloads))
+    return frame_header.pack(len(body) + 1, kind_cards) + body
+
+
+def pack_decisions(payloads) -> bytes:
+    # v1 client payloads -> one decisions frame
+    body = b"".join([decision_letter.get(p, b"?") for p in payloads])
+    return frame_header.pack(len(body) + 1, kind_decisions) + body
+
+
+def card_payloads(body):
+    # cards frame body -> v1 server payloads, None for a byte that is no card
+    return list(map(card_payload.__getitem__, body))
+
+
+def decision_payloads(body):
+    # decisions frame body -> v1 client payloads. an unknown letter becomes a
+    # payload with an unknown decision, which the server treats like in v1
+    return [letter_payload.get(b) or pack_client_payload(bytes([b]) * 5) for b in body]
+
+
+class frame_decoder:
+    # incremental: feed() whatever arrived, get back the complete frames
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data) -> list:
+        # returns [(kind, body)]
+        if not self.buf and len(data) >= 3 and (data[0] << 8 | data[1]) == len(data) - 2:
+            # exactly one whole frame, the usual case
+            return [(data[2], bytes(data[3:]))]
+        self.buf += data
+        frames = []
+        i = 0
+        while len(self.buf) - i >= 2:
+            length = (self.buf[i] << 8) | self.buf[i + 1]
+            if length == 0:
+                raise ConnectionError("empty v2 frame")
+            if len(self.buf) - i - 2 < length:
+                break
+            frames.append((self.buf[i + 2], bytes(self.buf[i + 3:i + 2 + length])))
+            i += 2 + length
+        del self.buf[:i]
+        return frames
+
+
+class payload_reader:
+    # frame_reader look-alike over a v2 connection: read(n) hands out the v1
+    # payloads the frames stand for, one at a time, so the v1 round code runs
+    # unchanged. read_some() -> bytes (b"" once the peer is gone) feeds it.
+    # other kinds (welcome, anything newer) are kept in self.other
+    def __init__(self, read_some, payload_kind, expand, unit):
+        self.read_some = read_some
+        self.payload_kind = payload_kind
+        self.expand = expand
+        self.unit = unit          # v1 payload size, for buffered()
+        self.decoder = frame_decoder()
+        self.pending = collections.deque()
+        self.other = []
+
+    def feed(self, data):
+        for kind, body in self.decoder.feed(data):
+            if kind == self.payload_kind:
+                self.pending.extend(self.expand(body))
+            else:
+                self.other.append((kind, body))
+
+    def read(self, n: int):
+        while not self.pending:
+            data = self.read_some()
+            if not data:
+                raise ConnectionError("peer disconnected")
+            self.feed(data)
+        payload = self.pending.popleft()
+        if payload is None:
+            raise ConnectionError("bad v2 payload")
+        return payload
+
+    def next_other(self):
+        # the next non-payload frame, reading until one comes
+        while not self.other:
+            data = self.read_some()
+            if not data:
+                raise ConnectionError("peer disconnected")
+            self.feed(data)
+        return self.other.pop(0)
+
+    def buffered(self) -> int:
+        return len(self.pending) * self.unit
+
+    def drop_frames(self, n: int) -> int:
+        count = len(self.pending)
+        self.pending.clear()
+        return count
+
+
+def client_reader(sock):
+    # client side: cards frames come out as 9-byte v1 server payloads
+    return payload_reader(lambda: sock.recv(4096), kind_cards, card_payloads, server_payload_len)
+
+
+class decision_socket:
+    # client side: sendall() of v1 decision payloads (one or a whole plan)
+    # goes out as one decisions frame
+    def __init__(self, sock):
+        self.sock = sock
+
+    def sendall(self, data):
+        self.sock.sendall(pack_decisions(data[i:i + client_payload_len]
+                                         for i in range(0, len(data), client_payload_len)))
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from common.constants import request_len, client_payload_len, server_payload_len, autoplay_request_len, request_v2_len
+from common.protocol import unpack_request, is_autoplay, unpack_autoplay_request
+from common.protocol_v2 import is_hello, unpack_hello
+from server.game_engine import (round_steps, new_shoe, next_session_id, session_rng, log_disconnect, drop_stale,
+                                handshake_lost)
+from server.round_store import session_recorder
+from server.leaderboard import team_recorder
+from common.cards import hand
+from server.log import session_log
+from server.settings import settings
+from server.session_pool import async_session_executor
+from server import metrics
+from server import reaper
+from server.autoplay import play_autoplay_async, autoplay_allowed
+from server import session_v2
+
+
+class stream_frames:
+    # frame_reader for an asyncio stream: a read takes whatever has arrived,
+    # so decisions a client sends ahead are served from memory and can be
+    # counted / dropped like in the threaded driver
+    def __init__(self, reader):
+        self.reader = reader
+        self.buf = bytearray()
+
+    async def read(self, n: int) -> bytes:
+        while len(self.buf) < n:
+            data = await self.reader.read(4096)
+            if not data:
+                raise asyncio.IncompleteReadError(bytes(self.buf), n)
+            self.buf += data
+        frame = bytes(self.buf[:n])
+        del self.buf[:n]
+        return frame
+
+    async def read_some(self) -> bytes:
+        # like frame_reader.read_some
+        if self.buf:
+            data = bytes(self.buf)
+            self.buf.clear()
+            return data
+        return await self.reader.read(4096)
+
+    def buffered(self) -> int:
+        return len(self.buf)
+
+    def drop_frames(self, n: int) -> int:
+        count = len(self.buf) // n
+        del self.buf[:count * n]
+        return count
+
+
+async def handle_client_async(reader, writer):
+    # coroutine version of game_engine.handle_client, one per connection
+    addr = writer.get_extra_info("peername")
+    slog = session_log(f"{addr[0]}:{addr[1]}")
+    slog.info("New connection. Waiting for protocol handshake...")
+    started = False
+    req = b""
+    timer = reaper.watch_stream(writer)
+    reader = stream_frames(reader)
+
+    try:
+        req = await reader.read(request_len)
+        v2 = is_hello(req)
+        if is_autoplay(req):
+            req += await reader.read(autoplay_request_len - request_len)
+            parsed = unpack_autoplay_request(req)
+        elif v2:
+            req += await reader.read(request_v2_len - request_len)
+            parsed = unpack_hello(req)
+        else:
+            parsed = unpack_request(req)
+        if parsed is None:
+            slog.warning("Sent invalid REQUEST packet. closing.")
+            metrics.add(metrics.handshake_failures)
+            return
+        if len(parsed) == 3 and not autoplay_allowed(parsed[0], slog):
+            metrics.add(metrics.handshake_failures)
+            return
+
+        rounds, client_name = parsed[:2]
+        stand_on = parsed[2] if len(parsed) == 3 else None
+        started = True
+        metrics.add(metrics.sessions_started)
+        metrics.add(metrics.bytes_in, len(req))
+        slog.rename(client_name)
+        session_id = next_session_id()
+        rng, seed_key = session_rng(session_id, client_name)
+        mode = f" (autoplay, stands on {stand_on})" if stand_on is not None else " (protocol v2)" if v2 else ""
+        slog.info("Handshake complete. Wants to play %d rounds%s. session %d, seed %r",
+                  rounds, mode, session_id, seed_key)
+
+        pending = []
+        out = writer
+        if v2:
+            reader = session_v2.stream_decisions(reader.read_some)
+            out = session_v2.card_writer(writer, session_v2.welcome(session_id, rounds))
+        cards = new_shoe(rng)
+        rec = session_recorder(session_id, client_name)
+        team = team_recorder(client_name)
+        if stand_on is not None:
+            await play_autoplay_async(writer, cards, rounds, stand_on, slog, rec, team, timer)
+        else:
+            for i in range(rounds):
+                slog.action("=== Round %d/%d ===", i + 1, rounds)
+                await play_one_round_async(reader, out, cards, slog, pending, rec, team, timer)
+        out.writelines(pending)
+        await out.drain()
+
+    except (ConnectionError, asyncio.IncompleteReadError):
+        if started:
+            log_disconnect(slog, timer)
+        else:
+            handshake_lost(slog, timer, req or reader.buffered())
+
+    except Exception as e:
+        slog.exception("Server Error: %s", e)
+    finally:
+        timer.done()
+        if started:
+            metrics.add(metrics.sessions_finished)
+        try:
+            writer.close()
+            slog.info("Connection closed.")
+        except Exception:
+            pass
+
+
+async def play_one_round_async(reader, writer, cards, slog, pending, rec=None, team=None, timer=None):
+    # drives game_engine.round_steps over asyncio streams (reader is a
+    # stream_frames). like the threaded driver, payloads collect in pending
+    # and go out in one write right before the next read that has to wait
+    # (the session flushes the last ones)
+    start = time.perf_counter()
+    if rec is None:
+        steps = round_steps(cards, slog)
+    else:
+        started_at = time.time()
+        player, dealer = hand(), hand()
+        steps = round_steps(cards, slog, player, dealer)
+    reads = sent = 0
+    try:
+        out = next(steps)
+        while True:
+            if out is None:
+                if reader.buffered() < client_payload_len:
+                    writer.writelines(pending)
+                    pending.clear()
+                    await writer.drain()
+                    if timer is not None:
+                        timer.expect(reaper.decision)
+                pkt = await reader.read(client_payload_len)
+                reads += 1
+                out = steps.send(pkt)
+            else:
+                sent += 1
+                pending.append(out)
+                out = next(steps)
+    except StopIteration as stop:
+        reads += drop_stale(reader, slog)
+        metrics.round_done(stop.value, time.perf_counter() - start,
+                           reads * client_payload_len, sent * server_payload_len)
+        if rec is not None:
+            rec(started_at, time.time(), stop.value, player.cards, dealer.cards)
+        if team is not None:
+            team(stop.value)
+        return stop.value
+
+
+def run_async_server(bind_ip: str, bind_port: int, handle_client_fn=handle_client_async, reuse_port=False,
+                     executor=None):
+    # same contract as tcp_server.run_tcp_server: serve in a daemon thread,
+    # return the actual port. all sessions share one event loop.
+    if executor is None:
+        executor = async_session_executor(handle_client_fn)
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(executor, bind_ip, bind_port, reuse_address=True,
+                             reuse_port=reuse_port, backlog=settings["backlog"])
+    )
+
+    # actual port (if bind_port = 0)
+    actual_port = server.sockets[0].getsockname()[1]
+
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+    return actual_port
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from common.constants import results_batch, results_header_len
+from common.protocol import pack_client_payload, pack_results
+from common.cards import hand
+from server import game_engine  # imports this module too, so by module
+from server.log import quiet_log
+from server.settings import settings
+from server import metrics
+from server import reaper
+
+# autoplay sessions: the client sends an autoplay request (rounds, stand_on)
+# instead of a request and the server plays every round itself, hitting
+# below stand_on and standing from there. the rounds are the same
+# round_steps an interactive session plays, on the session's own shoe, only
+# the decisions come from here. results go back one byte per round, up to
+# results_batch of them per frame, so a round costs no round trip at all.
+#
+# rounds are counted in metrics, the round store and the leaderboard like
+# any other. their per-round log lines are dropped (session lines stay).
+# a request for more than max_autoplay_rounds is refused at the handshake,
+# so one short packet cannot buy hours of server cpu.
+
+_hit = pack_client_payload(b"Hittt")
+_stand = pack_client_payload(b"Stand")
+
+
+def autoplay_allowed(rounds, slog) -> bool:
+    limit = settings["max_autoplay_rounds"]
+    if limit and rounds > limit:
+        slog.warning("Asked for %d autoplay rounds, the limit is %d. closing.", rounds, limit)
+        return False
+    return True
+
+
+def autoplay_round(cards, stand_on, rlog, rec=None, team=None):
+    start = time.perf_counter()
+    started_at = time.time() if rec is not None else 0.0
+    player, dealer = hand(), hand()
+    steps = game_engine.round_steps(cards, rlog, player, dealer)
+    try:
+        payload = next(steps)
+        while True:
+            if payload is None:
+                payload = steps.send(_hit if player.total() < stand_on else _stand)
+            else:
+                payload = next(steps)
+    except StopIteration as stop:
+        result = stop.value
+    metrics.round_done(result, time.perf_counter() - start, 0, 1)
+    if rec is not None:
+        rec(started_at, time.time(), result, player.cards, dealer.cards)
+    if team is not None:
+        team(result)
+    return result
+
+
+def autoplay_batches(cards, rounds, stand_on, slog, rec=None, team=None):
+    # yields one results frame per results_batch rounds
+    rlog = quiet_log(slog.extra["client_id"])
+    left = rounds
+    while left:
+        n = min(left, results_batch)
+        codes = bytearray(n)
+        for i in range(n):
+            codes[i] = autoplay_round(cards, stand_on, rlog, rec, team)
+        left -= n
+        metrics.add(metrics.bytes_out, results_header_len)
+        yield pack_results(bytes(codes))
+
+
+def play_autoplay(out, cards, rounds, stand_on, slog, rec=None, team=None, timer=None):
+    # threaded driver. a client that stops reading blocks the send, the
+    # decision deadline covers that like a missing decision
+    for frame in autoplay_batches(cards, rounds, stand_on, slog, rec, team):
+        if timer is not None:
+            timer.expect(reaper.decision)
+        out.add(frame)
+        out.flush()
+
+
+async def play_autoplay_async(writer, cards, rounds, stand_on, slog, rec=None, team=None, timer=None):
+    # asyncio driver. the batches are played on the loop's default executor,
+    # a batch is tens of ms of cpu that would stall every other session on
+    # the loop. the loop only writes the frames
+    loop = asyncio.get_running_loop()
+    batches = autoplay_batches(cards, rounds, stand_on, slog, rec, team)
+    while True:
+        frame = await loop.run_in_executor(None, next, batches, None)
+        if frame is None:
+            break
+        if timer is not None:
+            timer.expect(reaper.decision)
+        writer.write(frame)
+        await writer.drain()
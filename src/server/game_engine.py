@@ -1,8 +1,21 @@
-from common.net_utils import recv_exact
-from common.constants import request_len, client_payload_len
-from common.protocol import unpack_request, pack_server_payload, unpack_client_payload
-from common.cards import deck, hand, encode_card, rank_value
-import traceback
+from common.net_utils import frame_reader, send_buffer
+from common.constants import request_len, client_payload_len, server_payload_len, autoplay_request_len, request_v2_len
+from common.protocol import unpack_request, unpack_client_payload, is_autoplay, unpack_autoplay_request
+from common.protocol_v2 import is_hello, unpack_hello
+from common.cards import shoe, hand, rank_value, card_of_code
+from common.frames import server_frames
+from server.log import session_log
+from server.settings import settings
+from server import metrics
+from server.round_store import session_recorder
+from server.leaderboard import team_recorder
+from server import reaper
+from server import autoplay
+from server import session_v2
+import itertools
+import random
+import threading
+import time
 
 # result codes
 res_not_over = 0x0
@@ -10,137 +23,318 @@ res_tie = 0x1
 res_loss = 0x2
 res_win = 0x3
 
+# ready-made payload rows, indexed by card code
+frames_not_over = server_frames[res_not_over]
+
+_session_counter = itertools.count(1)
+_team_sessions = {}
+_team_lock = threading.Lock()
+
 
 def handle_client(conn, addr):
     # Initial temporary ID
-    client_id = f"{addr[0]}:{addr[1]}"
-    print(f"\nNew connection from {client_id}. Waiting for protocol handshake...")
+    slog = session_log(f"{addr[0]}:{addr[1]}")
+    slog.info("New connection. Waiting for protocol handshake...")
+    started = False
+    req = b""
+    timer = reaper.watch_socket(conn)
 
     try:
-        conn.settimeout(600)  # 10 minutes timeout
-
-        req = recv_exact(conn, request_len)
-        parsed = unpack_request(req)
+        reader = frame_reader(conn)
+        req = bytes(reader.read(request_len))
+        v2 = is_hello(req)
+        if is_autoplay(req):
+            req += bytes(reader.read(autoplay_request_len - request_len))
+            parsed = unpack_autoplay_request(req)
+        elif v2:
+            req += bytes(reader.read(request_v2_len - request_len))
+            parsed = unpack_hello(req)
+        else:
+            parsed = unpack_request(req)
         if parsed is None:
-            print(f"[{client_id}] Sent invalid REQUEST packet. closing.")
+            slog.warning("Sent invalid REQUEST packet. closing.")
+            metrics.add(metrics.handshake_failures)
             conn.close()
             return
+        if len(parsed) == 3 and not autoplay.autoplay_allowed(parsed[0], slog):
+            metrics.add(metrics.handshake_failures)
+            return
 
-        rounds, client_name = parsed
+        rounds, client_name = parsed[:2]
+        stand_on = parsed[2] if len(parsed) == 3 else None
+        started = True
+        metrics.add(metrics.sessions_started)
+        metrics.add(metrics.bytes_in, len(req))
         # Update ID to include the Team Name
-        client_id = f"{client_name}"
-        print(f"\n[{client_id}] Handshake complete. Wants to play {rounds} rounds.")
+        slog.rename(client_name)
+        session_id = next_session_id()
+        rng, seed_key = session_rng(session_id, client_name)
+        mode = f" (autoplay, stands on {stand_on})" if stand_on is not None else " (protocol v2)" if v2 else ""
+        slog.info("Handshake complete. Wants to play %d rounds%s. session %d, seed %r",
+                  rounds, mode, session_id, seed_key)
 
-        for i in range(rounds):
-            print(f"\n=== Round {i + 1}/{rounds} for {client_id} ===")
-            play_one_round(conn, client_id)
-            print(f"=== Round {i + 1} Finished for {client_id} ===\n")
+        if v2:
+            reader = session_v2.decision_reader(reader.read_some)
+            out = session_v2.card_buffer(conn, session_v2.welcome(session_id, rounds))
+        else:
+            out = send_buffer(conn)
+        cards = new_shoe(rng)
+        rec = session_recorder(session_id, client_name)
+        team = team_recorder(client_name)
+        if stand_on is not None:
+            autoplay.play_autoplay(out, cards, rounds, stand_on, slog, rec, team, timer)
+        else:
+            for i in range(rounds):
+                slog.action("=== Round %d/%d ===", i + 1, rounds)
+                play_one_round(reader, cards, slog, out, rec, team, timer)
+        out.flush()
 
     except ConnectionError:
-        print(f"[{client_id}] Disconnected abruptly.")
+        if started:
+            log_disconnect(slog, timer)
+        else:
+            handshake_lost(slog, timer, req or reader.buffered())
 
     except Exception as e:
-        print(f"[{client_id}] Server Error: {e}")
-        traceback.print_exc()
+        slog.exception("Server Error: %s", e)
     finally:
+        timer.done()
+        if started:
+            metrics.add(metrics.sessions_finished)
         try:
             conn.close()
-            print(f"[{client_id}] Connection closed.")
+            slog.info("Connection closed.")
         except Exception:
             pass
 
 
-def play_one_round(conn, client_id):
-    d = deck()
-    player = hand()
-    dealer = hand()
+def handshake_lost(slog, timer, received):
+    # the connection ended before a complete request. one that never sent a
+    # byte and was not reaped is a client measuring connect rtt
+    # (client/probe.py), not a failed handshake
+    if not received and timer.reaped is None:
+        slog.debug("Closed without sending anything (connect probe).")
+        metrics.add(metrics.probes)
+    else:
+        log_disconnect(slog, timer)
+        metrics.add(metrics.handshake_failures)
+
+
+def log_disconnect(slog, timer):
+    if timer.reaped is None:
+        slog.info("Disconnected abruptly.")
+    elif timer.reaped == reaper.session:
+        slog.info("Session ran past its time limit, closed.")
+    else:
+        slog.info("No %s in time, closed.", "request" if timer.reaped == reaper.handshake else "decision")
+
+
+def next_session_id() -> int:
+    # unique across forked workers too: worker i hands out ids = i (mod workers)
+    stride = max(1, settings["workers"])
+    return next(_session_counter) * stride + settings["worker_index"]
+
+
+def session_rng(session_id, client_name):
+    # every session shuffles with its own generator instead of the shared
+    # module-level one. the seed key is logged at handshake, so
+    # random.Random(key) deals the exact same shoe again.
+    # in deterministic mode the key does not depend on arrival order but on
+    # the team name and how many sessions that team had so far.
+    if settings["deterministic"]:
+        with _team_lock:
+            n = _team_sessions.get(client_name, 0) + 1
+            _team_sessions[client_name] = n
+        key = f"{settings['seed']}:{client_name}:{n}"
+    else:
+        key = f"{settings['seed']}:{session_id}"
+    return random.Random(key), key
+
+
+def new_shoe(rng=None):
+    # one shoe per session, kept across its rounds
+    return shoe(settings["decks"], settings["penetration"], rng)
+
+
+def play_one_round(reader, cards, slog, out, rec=None, team=None, timer=None):
+    # drives one round over a blocking socket (read through a frame_reader).
+    # payloads collect in out (a send_buffer) and only go out when the round
+    # waits for the client, the last ones of a round ride along with the
+    # next round's deal (handle_client flushes after the last round).
+    # rec is the session's round_store recorder and team its leaderboard
+    # recorder, timer the session's reaper watch, any of them can be None.
+    # decisions the client sends ahead (pipelining) are read from the
+    # buffer without flushing in between, their cards go out together
+    start = time.perf_counter()
+    if rec is None:
+        steps = round_steps(cards, slog)
+    else:
+        started_at = time.time()
+        player, dealer = hand(), hand()
+        steps = round_steps(cards, slog, player, dealer)
+    reads = sent = 0
+    try:
+        payload = next(steps)
+        while True:
+            if payload is None:
+                # the round wants the next client decision
+                if reader.buffered() < client_payload_len:
+                    out.flush()
+                    if timer is not None:
+                        timer.expect(reaper.decision)
+                reads += 1
+                payload = steps.send(reader.read(client_payload_len))
+            else:
+                sent += 1
+                out.add(payload)
+                payload = next(steps)
+    except StopIteration as stop:
+        reads += drop_stale(reader, slog)
+        metrics.round_done(stop.value, time.perf_counter() - start,
+                           reads * client_payload_len, sent * server_payload_len)
+        if rec is not None:
+            rec(started_at, time.time(), stop.value, player.cards, dealer.cards)
+        if team is not None:
+            team(stop.value)
+        return stop.value
+
+
+def drop_stale(reader, slog) -> int:
+    # at the end of a round: decisions still buffered were sent ahead past
+    # the end of this round (hits queued behind a bust, anything after the
+    # stand). the next deal has not gone out yet, so none of them can be
+    # meant for the next round
+    dropped = reader.drop_frames(client_payload_len)
+    if dropped:
+        slog.action("Dropped %d decisions sent past the end of the round.", dropped)
+    return dropped
+
+
+def round_steps(cards, slog, player=None, dealer=None):
+    # the round logic without any socket io, so the threaded and the asyncio
+    # servers play exactly the same game.
+    # yields a server payload to send, or None when it needs a client payload,
+    # which the driver passes back in with send(). returns the final result.
+    # cards is the session's shoe, cards are dealt as codes 0-51.
+    # pass empty hands in as player / dealer to see the cards afterwards.
+    cards.start_round()
+    if player is None:
+        player = hand()
+        dealer = hand()
 
     # Deal initial cards
-    player.add(d.draw())
-    player.add(d.draw())
-    dealer.add(d.draw())  # Up card
-    dealer.add(d.draw())  # Hidden card
+    p1 = cards.draw()
+    p2 = cards.draw()
+    up = cards.draw()  # Up card
+    hidden = cards.draw()  # Hidden card
+    player.add(p1)
+    player.add(p2)
+    dealer.add(up)
+    dealer.add(hidden)
 
     # Send initial cards
-    for card in player.items:
-        conn.sendall(pack_server_payload(res_not_over, encode_card(card[0], card[1])))
-
-    up = dealer.items[0]
-    conn.sendall(pack_server_payload(res_not_over, encode_card(up[0], up[1])))
+    yield frames_not_over[p1]
+    yield frames_not_over[p2]
+    yield frames_not_over[up]
 
     # Player Turn Loop
+    if (yield from player_turn(cards, player, slog)):
+        return res_loss  # End round
+
+    # Dealer Turn
+    dealer_turn(cards, dealer, slog)
+    frames, final = dealer_frames(dealer, player.total(), slog)
+    for f in frames:
+        yield f
+    return final
+
+
+def player_turn(cards, player, slog):
+    # hits until the player stands or busts. yields like round_steps,
+    # returns True if the player busted (the LOSS payload is already yielded)
     while True:
-        pkt = recv_exact(conn, client_payload_len)
+        pkt = yield None
         decision5 = unpack_client_payload(pkt)
 
         if decision5 is None:
+            metrics.add(metrics.bad_payloads)
             raise ConnectionError("Client sent bad payload")
 
         if decision5 == b"Hittt":
-            c = d.draw()
+            c = cards.draw()
             player.add(c)
-            print(f"[{client_id}] ACTION: Hit -> Drew {rank_value(c[0])}. Total: {player.total()}")
+            if slog.actions:
+                slog.action("ACTION: Hit -> Drew %d. Total: %d", rank_value(card_of_code[c][0]), player.total())
 
             if player.is_bust():
-                print(f"[{client_id}] RESULT: PLAYER Busted! (Total {player.total()} > 21). Sending LOSS.")
-                conn.sendall(pack_server_payload(res_loss, encode_card(c[0], c[1])))
-                return  # End round
+                slog.info("RESULT: PLAYER Busted! (Total %d > 21). Sending LOSS.", player.total())
+                yield server_frames[res_loss][c]
+                return True
             else:
-                conn.sendall(pack_server_payload(res_not_over, encode_card(c[0], c[1])))
+                yield frames_not_over[c]
             continue
 
         elif decision5 == b"Stand":
-            print(f"[{client_id}] ACTION: Stand. Final Player Total: {player.total()}")
-            break
+            if slog.actions:
+                slog.action("ACTION: Stand. Final Player Total: %d", player.total())
+            return False
         else:
-            print(f"[{client_id}] Received unknown command. Stopping round.")
-            break
+            slog.warning("Received unknown command. Stopping round.")
+            return False
 
-    # Dealer Turn
-    # always reveal the hidden card first (round is still not over)
-    hidden = dealer.items[1]
-    if dealer.is_bust():
-        conn.sendall(pack_server_payload(res_loss, encode_card(hidden[0], hidden[1])))
-        return
-    if dealer.total() < 17:
-        conn.sendall(pack_server_payload(res_not_over, encode_card(hidden[0], hidden[1])))
-
-    # dealer draws until reaching 17 or more
-    last = encode_card(hidden[0], hidden[1])
+
+def dealer_turn(cards, dealer, slog):
+    # dealer draws until reaching 17 or more (stands on soft 17 too)
     while dealer.total() < 17:
-        print(f"[Dealer] has {dealer.total()}, drawing...")
-        c = d.draw()
+        c = cards.draw()
         dealer.add(c)
-        print(f"[Dealer] Drew {rank_value(c[0])}. New Total: {dealer.total()}")
+        if slog.actions:
+            slog.action("Dealer Drew %d. New Total: %d", rank_value(card_of_code[c][0]), dealer.total())
+    if slog.actions:
+        slog.action("Dealer current score: %d", dealer.total())
+
+
+def dealer_frames(dealer, p, slog):
+    # what a player who stood on p sees of the finished dealer hand:
+    # the hidden card (if the dealer had to draw), every draw below 17 as
+    # not-over, and the result riding on the last card. returns (payloads, result)
+    codes = dealer.cards
+    hidden = codes[1]
+    shown = hand()
+    shown.add(codes[0])
+    shown.add(hidden)
+    frames = []
+
+    # always reveal the hidden card first (round is still not over)
+    if shown.total() < 17:
+        frames.append(frames_not_over[hidden])
 
+    last = hidden
+    for c in codes[2:]:
+        shown.add(c)
         # if dealer busts on this draw, send the busting card with the final WIN result
-        if dealer.is_bust():
-            conn.sendall(pack_server_payload(res_win, encode_card(c[0], c[1])))
-            print(f"[{client_id}] RESULT: PLAYER WIN -- > Dealer Busted with value: {dealer.total()}")
-            return
+        if shown.is_bust():
+            frames.append(server_frames[res_win][c])
+            slog.info("RESULT: PLAYER WIN -- > Dealer Busted with value: %d", shown.total())
+            return frames, res_win
 
         # otherwise, keep sending cards as not-over
-        if dealer.total() < 17:
-            conn.sendall(pack_server_payload(res_not_over, encode_card(c[0], c[1])))
-            print(f"Dealer Drew {rank_value(c[0])}. New Total: {dealer.total()}")
-        else :
-            last = encode_card(c[0], c[1])
-    print(f"[Dealer] current score: {dealer.total()}")
-    # Final Result
-    p = player.total()
-    dlr = dealer.total()
+        if shown.total() < 17:
+            frames.append(frames_not_over[c])
+        else:
+            last = c
 
-    if dealer.is_bust():
-        final = res_win
-        print(f"[{client_id}] RESULT: PLAYER WIN (Dealer Busted)")
-    elif p > dlr:
+    # Final Result
+    dlr = shown.total()
+    if p > dlr:
         final = res_win
-        print(f"[{client_id}] RESULT: PLAYER WIN {p} > {dlr}")
+        slog.info("RESULT: PLAYER WIN %d > %d", p, dlr)
     elif p < dlr:
         final = res_loss
-        print(f"[{client_id}] RESULT: CLIENT LOSS {p} < {dlr}")
+        slog.info("RESULT: CLIENT LOSS %d < %d", p, dlr)
     else:
         final = res_tie
-        print(f"Tie ({p} vs {dlr}).")
+        slog.info("RESULT: Tie (%d vs %d).", p, dlr)
 
-    conn.sendall(pack_server_payload(final, last))
\ No newline at end of file
+    frames.append(server_frames[final][last])
+    return frames, final
@@ -0,0 +1,230 @@
+import atexit
+import functools
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+# live leaderboard by team name: wins, rounds, win rate, streaks.
+# sessions never touch the index. they put (team, result) on a queue and a
+# single applier thread updates it, so thousands of sessions do not contend
+# on a lock. the lock below is only shared between the applier and readers
+# (the http endpoint, the console, snapshots).
+#
+# ranking is by wins, then fewer rounds, then name: one skip list of
+# (-wins, rounds, name). an update removes the team's old key and inserts the
+# new one, O(log n) expected however many teams share a win count (early on
+# that is all of them). top-k walks the first k entries.
+#
+# with --workers every worker process keeps its own board over the sessions
+# it served; there is no server-wide board across workers.
+
+res_tie = 0x1
+res_loss = 0x2
+res_win = 0x3
+
+# per team stats slots
+wins, losses, ties, streak, best_streak = range(5)
+
+_board = None
+
+
+class ranking:
+    # skip list of unique keys in ascending order. a node is [key, next at
+    # level 0, next at level 1, ...], the head is a node without a key
+    max_level = 32
+
+    def __init__(self):
+        self.head = [None] * (self.max_level + 1)
+        self.level = 1
+        self.size = 0
+        self.rng = random.Random()  # own generator, the shoe may be seeded
+
+    def _path(self, key):
+        # last node before key on every level
+        path = [self.head] * self.max_level
+        x = self.head
+        for i in range(self.level, 0, -1):
+            while x[i] is not None and x[i][0] < key:
+                x = x[i]
+            path[i - 1] = x
+        return path
+
+    def insert(self, key):
+        path = self._path(key)
+        height = 1
+        while height < self.max_level and self.rng.random() < 0.25:
+            height += 1
+        self.level = max(self.level, height)
+        node = [key] + [None] * height
+        for i in range(1, height + 1):
+            node[i] = path[i - 1][i]
+            path[i - 1][i] = node
+        self.size += 1
+
+    def remove(self, key):
+        path = self._path(key)
+        node = path[0][1]
+        if node is None or node[0] != key:
+            raise KeyError(key)
+        for i in range(1, len(node)):
+            path[i - 1][i] = node[i]
+        self.size -= 1
+
+    def __iter__(self):
+        x = self.head[1]
+        while x is not None:
+            yield x[0]
+            x = x[1]
+
+    def __len__(self):
+        return self.size
+
+
+class leaderboard:
+    def __init__(self, path=None, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self.q = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.teams = {}      # name -> [wins, losses, ties, streak, best_streak]
+        self.ranked = ranking()  # (-wins, rounds, name) of every team
+        if path:
+            self._load()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, name, result):
+        # called by sessions at the end of every round
+        self.q.put((name, result))
+
+    # --- applier thread ---
+
+    def _run(self):
+        next_snapshot = time.monotonic() + self.interval
+        while True:
+            try:
+                batch = [self.q.get(timeout=max(0.0, next_snapshot - time.monotonic()))]
+                while len(batch) < 4096:
+                    try:
+                        batch.append(self.q.get_nowait())
+                    except queue.Empty:
+                        break
+            except queue.Empty:
+                batch = []
+            stop = None in batch
+            with self.lock:
+                for item in batch:
+                    if item is not None:
+                        self._apply(*item)
+            if self.path and (stop or time.monotonic() >= next_snapshot):
+                self.snapshot()
+                next_snapshot = time.monotonic() + self.interval
+            if stop:
+                return
+
+    def _apply(self, name, result):
+        t = self.teams.get(name)
+        if t is None:
+            t = self.teams[name] = [0, 0, 0, 0, 0]
+        else:
+            self._leave(name, t)
+        if result == res_win:
+            t[wins] += 1
+            t[streak] += 1
+            if t[streak] > t[best_streak]:
+                t[best_streak] = t[streak]
+        else:
+            t[losses if result == res_loss else ties] += 1
+            t[streak] = 0
+        self._enter(name, t)
+
+    def _enter(self, name, t):
+        self.ranked.insert((-t[wins], t[wins] + t[losses] + t[ties], name))
+
+    def _leave(self, name, t):
+        self.ranked.remove((-t[wins], t[wins] + t[losses] + t[ties], name))
+
+    # --- readers ---
+
+    def _row(self, name, t):
+        rounds = t[wins] + t[losses] + t[ties]
+        return {"team": name, "wins": t[wins], "rounds": rounds,
+                "win_rate": round(t[wins] / rounds, 4) if rounds else 0.0,
+                "losses": t[losses], "ties": t[ties], "streak": t[streak], "best_streak": t[best_streak]}
+
+    def top(self, k=10):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        with self.lock:
+            out = [self._row(n, self.teams[n]) for _, _, n in itertools.islice(self.ranked, k)]
+            n_teams = len(self.teams)
+        for rank, row in enumerate(out, 1):
+            row["rank"] = rank
+        return {"teams": n_teams, "top": out}
+
+    def team(self, name):
+        with self.lock:
+            t = self.teams.get(name)
+            return None if t is None else self._row(name, t)
+
+    def snapshot(self):
+        # whole table to self.path, written to a temp file and renamed
+        with self.lock:
+            data = {name: list(t) for name, t in self.teams.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"saved": time.time(), "fields": ["wins", "losses", "ties", "streak", "best_streak"],
+                       "teams": data}, f)
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)["teams"]
+        except (OSError, ValueError, KeyError):
+            return
+        for name, t in data.items():
+            self.teams[name] = list(t)
+            self._enter(name, self.teams[name])
+
+    def close(self):
+        # applies everything queued and writes a last snapshot
+        self.q.put(None)
+        self.thread.join()
+
+
+def start_leaderboard(path=None, interval=10.0):
+    # one board per process
+    global _board
+    if _board is None:
+        _board = leaderboard(path, interval)
+        atexit.register(_board.close)
+    return _board
+
+
+def board():
+    return _board
+
+
+def team_recorder(client_name):
+    # None when the leaderboard is off, else rec(result)
+    if _board is None:
+        return None
+    return functools.partial(_board.record, client_name)
+
+
+def top_json(params):
+    # /leaderboard?k=10 and /leaderboard?team=NAME on the metrics port
+    if "team" in params:
+        return json.dumps(_board.team(params["team"][0]))
+    try:
+        k = int(params.get("k", ["10"])[0])
+    except ValueError:
+        k = 10
+    if k < 1:
+        return json.dumps({"error": "k must be at least 1"})
+    return json.dumps(_board.top(k))
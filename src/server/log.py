@@ -0,0 +1,81 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# every server message goes through this logger.
+# per-card / per-action chatter is DEBUG, session and round results are INFO,
+# so INFO (or higher) in production keeps the round loop free of it.
+log = logging.getLogger("blackjack")
+log.setLevel(logging.INFO)
+log.propagate = False
+
+# fraction of sessions whose per-action lines are kept (at DEBUG)
+action_sample = {"rate": 1.0}
+
+levels = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING,
+          "error": logging.ERROR, "off": logging.CRITICAL + 1}
+
+_listener = None
+
+
+def setup_logging(level="info", sample=1.0, stream=None):
+    # callers only put records on a queue, a background thread formats and
+    # writes them, so a slow terminal never blocks a session thread
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    q = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(q, handler)
+    _listener.start()
+
+    log.handlers[:] = [logging.handlers.QueueHandler(q)]
+    log.setLevel(levels[level.lower()] if isinstance(level, str) else level)
+    action_sample["rate"] = sample
+    return _listener
+
+
+def stop_logging():
+    # flushes whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class session_log(logging.LoggerAdapter):
+    # prefixes every line with the session's id ("[team] ...").
+    # self.actions says whether this session's per-action lines are wanted,
+    # checked before building them so a disabled line costs one attribute read
+    def __init__(self, client_id):
+        super().__init__(log, {"client_id": client_id})
+        rate = action_sample["rate"]
+        self.actions = log.isEnabledFor(logging.DEBUG) and (rate >= 1.0 or random.random() < rate)
+
+    def rename(self, client_id):
+        self.extra["client_id"] = client_id
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['client_id']}] {msg}", kwargs
+
+    def action(self, msg, *args):
+        if self.actions:
+            self.debug(msg, *args)
+
+
+class quiet_log(session_log):
+    # for rounds nobody is watching (autoplay): only warnings and errors get through
+    def __init__(self, client_id):
+        super().__init__(client_id)
+        self.actions = False
+
+    def isEnabledFor(self, level):
+        return level >= logging.WARNING and self.logger.isEnabledFor(level)
@@ -1,30 +1,178 @@
+import argparse
+import os
+import random
 import threading
 from server.udp_broadcast import run_udp_broadcaster
-from server.tcp_server import run_tcp_server
-from server.game_engine import handle_client
+from server.table import scheduler
+from server.workers import start_serving, start_workers, print_worker_status, worker_load
+from server.session_pool import format_stats
+from server.settings import settings
+from server.log import setup_logging
+from server import leaderboard
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="blackjack server")
+    p.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                   help="threaded = one thread per client, async = one coroutine per client")
+    p.add_argument("--port", type=int, default=0, help="tcp port (default: let os choose)")
+    p.add_argument("--workers", type=int, default=0,
+                   help="fork N server processes sharing the tcp port (SO_REUSEPORT), 0 = single process")
+    p.add_argument("--max-sessions", type=int, default=settings["max_sessions"],
+                   help="sessions played at the same time (per worker)")
+    p.add_argument("--max-queued", type=int, default=settings["max_queued"],
+                   help="connections waiting for a free slot, beyond that new ones are closed")
+    p.add_argument("--backlog", type=int, default=settings["backlog"], help="tcp listen backlog")
+    p.add_argument("--decks", type=int, default=settings["decks"], help="decks in each session's shoe")
+    p.add_argument("--penetration", type=float, default=settings["penetration"],
+                   help="share of the shoe dealt before reshuffling (0-1)")
+    p.add_argument("--seed", type=int, default=None,
+                   help="server seed for the session rngs (default: random, printed at startup)")
+    p.add_argument("--deterministic", action="store_true",
+                   help="replayable runs: seed defaults to 0 and session rngs depend on team name + "
+                        "session count instead of arrival order (use with a single process)")
+    p.add_argument("--log-level", choices=["debug", "info", "warning", "error", "off"], default="info",
+                   help="debug adds every hit / stand / dealer draw, info logs sessions and round results")
+    p.add_argument("--log-sample", type=float, default=1.0,
+                   help="fraction of sessions whose per-action debug lines are kept")
+    p.add_argument("--table-seats", type=int, default=0, metavar="N",
+                   help="threaded mode: seat up to N players at a table sharing one shoe and one dealer "
+                        "turn per round (0 = every player has a private dealer)")
+    p.add_argument("--round-store", default=None, metavar="PATH",
+                   help="append a binary record of every finished round to PATH "
+                        "(with --workers, worker i writes PATH with .w<i> before the extension)")
+    p.add_argument("--leaderboard", nargs="?", const="", default=None, metavar="PATH",
+                   help="keep a live leaderboard by team name (enter prints it, /leaderboard?k=10 on the "
+                        "metrics port); with PATH it is snapshotted there as json and reloaded at start. "
+                        "with --workers each worker keeps its own board over its own sessions (on its metrics "
+                        "port, PATH with .w<i>), there is no combined server-wide board")
+    p.add_argument("--leaderboard-interval", type=float, default=settings["leaderboard_interval"],
+                   help="seconds between leaderboard snapshots")
+    p.add_argument("--handshake-timeout", type=float, default=settings["handshake_timeout"],
+                   help="seconds a new connection has to send its request (0 = no limit)")
+    p.add_argument("--decision-timeout", type=float, default=settings["decision_timeout"],
+                   help="seconds a client has for each hit / stand (0 = no limit)")
+    p.add_argument("--session-timeout", type=float, default=settings["session_timeout"],
+                   help="seconds a whole session may take (0 = no limit)")
+    p.add_argument("--max-autoplay-rounds", type=int, default=settings["max_autoplay_rounds"],
+                   help="autoplay requests asking for more rounds are refused (0 = no limit)")
+    p.add_argument("--metrics-port", type=int, default=None,
+                   help="serve prometheus metrics on 127.0.0.1:PORT/metrics (with --workers, worker i "
+                        "uses PORT+i)")
+    p.add_argument("--profile", type=float, default=float(os.environ.get("BLACKJACK_PROFILE", 0)),
+                   metavar="SAMPLE", help="run this share of sessions (0-1) under cProfile and write reports "
+                                          "(default: $BLACKJACK_PROFILE or 0 = off)")
+    p.add_argument("--profile-dir", default=settings["profile_dir"],
+                   help="where session profiles and report-<pid>.txt are written")
+    p.add_argument("--profile-interval", type=float, default=settings["profile_interval"],
+                   help="seconds between profile reports")
+    p.add_argument("--profile-top", type=int, default=settings["profile_top"], help="lines per report section")
+    p.add_argument("--tracemalloc", action="store_true",
+                   help="with --profile, also trace allocations and snapshot them every interval")
+    args = p.parse_args()
+    if args.table_seats and args.mode != "threaded":
+        p.error("--table-seats needs --mode threaded")
+    if args.workers > 0 and args.metrics_port == 0:
+        p.error("--metrics-port 0 cannot be combined with --workers, give a fixed port")
+    return args
+
+
+def print_leaderboard(top):
+    print(f"  {'#':<3}{'team':<34}{'wins':>6}{'rounds':>8}{'win %':>7}{'streak':>7}{'best':>6}")
+    for r in top["top"]:
+        print(f"  {r['rank']:<3}{r['team']:<34}{r['wins']:>6}{r['rounds']:>8}{r['win_rate']:>7.1%}"
+              f"{r['streak']:>7}{r['best_streak']:>6}")
 
 
 def main():
+    args = parse_args()
+    settings["max_sessions"] = args.max_sessions
+    settings["max_queued"] = args.max_queued
+    settings["backlog"] = args.backlog
+    settings["decks"] = args.decks
+    settings["penetration"] = args.penetration
+    if args.seed is not None:
+        settings["seed"] = args.seed
+    elif not args.deterministic:
+        settings["seed"] = random.SystemRandom().randrange(2 ** 32)
+    settings["deterministic"] = args.deterministic
+    settings["metrics_port"] = args.metrics_port
+    settings["handshake_timeout"] = args.handshake_timeout
+    settings["decision_timeout"] = args.decision_timeout
+    settings["session_timeout"] = args.session_timeout
+    settings["max_autoplay_rounds"] = args.max_autoplay_rounds
+    settings["round_store"] = args.round_store
+    settings["table_seats"] = args.table_seats
+    settings["leaderboard"] = args.leaderboard is not None
+    settings["leaderboard_path"] = args.leaderboard or None
+    settings["leaderboard_interval"] = args.leaderboard_interval
+    settings["profile_sample"] = args.profile
+    settings["profile_dir"] = args.profile_dir
+    settings["profile_interval"] = args.profile_interval
+    settings["profile_top"] = args.profile_top
+    settings["profile_tracemalloc"] = args.tracemalloc
+    settings["log_level"] = args.log_level
+    settings["log_sample"] = args.log_sample
+
     #bind_ip = "172.18.16.150" # TODO: CHECK IPCONFIG FOR CORRECT IP BECAUSE WSL WIFI CARD HIJACKS TRAFFIC
     bind_ip = "0.0.0.0"
-    bind_port = 0  # let os choose
+    bind_port = args.port  # 0 = let os choose
     server_name = ("Bomboclattt Server")
 
     stop_flag = {"stop": False}
 
-    tcp_port = run_tcp_server(bind_ip, bind_port, handle_client)
+    worker_stats = None
+    executor = None
+    if args.workers > 0:
+        try:
+            tcp_port, worker_stats = start_workers(args.workers, args.mode, bind_ip, bind_port)
+        except RuntimeError as e:
+            raise SystemExit(f"server: {e}")
+        # only now: the log listener is a thread, a forked worker would get
+        # the queue without it. every worker starts its own in start_serving
+        setup_logging(args.log_level, args.log_sample)
+    else:
+        executor, tcp_port, metrics_port = start_serving(args.mode, bind_ip, bind_port)
+        if metrics_port is not None:
+            print(f"metrics on http://127.0.0.1:{metrics_port}/metrics")
+
+    if worker_stats is not None and args.metrics_port is not None:
+        print(f"metrics on http://127.0.0.1:{args.metrics_port}-{args.metrics_port + args.workers - 1}/metrics")
+
+    # load advertised next to the offers: sessions playing, waiting, and how many can play at once
+    if worker_stats is not None:
+        capacity = settings["max_sessions"] * args.workers
+        load_fn = lambda: worker_load(worker_stats) + (capacity,)
+    else:
+        def load_fn():
+            s = executor.stats()
+            return s["active"], s["queued"], settings["max_sessions"]
 
-    t = threading.Thread(target=run_udp_broadcaster, args=(tcp_port, server_name, stop_flag), daemon=True)
+    t = threading.Thread(target=run_udp_broadcaster, args=(tcp_port, server_name, stop_flag, load_fn), daemon=True)
     t.start()
 
-    print(f"server up on tcp port {tcp_port}")
+    print(f"server up on tcp port {tcp_port} ({args.mode} mode"
+          + (f", tables of {args.table_seats})" if args.table_seats else ")"))
+    print(f"seed {settings['seed']}" + (" (deterministic)" if args.deterministic else ""))
+    if settings["profile_sample"] > 0:
+        print(f"profiling {settings['profile_sample']:.0%} of sessions into {settings['profile_dir']}/")
+    print("press enter for session counters")
     try:
         while True:
             input()  # press enter to quit
+            if worker_stats is not None:
+                print_worker_status(worker_stats)
+            else:
+                print(f"sessions: {format_stats(executor.stats())}")
+                if args.table_seats:
+                    ts = scheduler().stats()
+                    print(f"tables: {ts['tables']} open, {ts['seated']} seated, {ts['rounds']} rounds dealt")
+                if leaderboard.board() is not None:
+                    print_leaderboard(leaderboard.board().top(5))
     except KeyboardInterrupt:
         pass
     stop_flag["stop"] = True
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
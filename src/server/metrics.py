@@ -0,0 +1,179 @@
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+# in-process counters for the server, scraped in prometheus text format.
+# every thread counts into its own shard (a plain list, no lock on the hot
+# path), a scrape sums the shards. in async mode everything runs on the loop
+# thread, so there is a single shard.
+
+# round duration histogram bounds, seconds (the round includes client think time)
+duration_buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0)
+
+# shard slots
+sessions_started = 0
+sessions_finished = 1
+bytes_in = 2
+bytes_out = 3
+handshake_failures = 4
+bad_payloads = 5
+results = 6                       # 6 + result code (1 tie, 2 loss, 3 win)
+duration_sum = 10
+duration_counts = 11              # one per bucket, then +Inf
+reaped = duration_counts + len(duration_buckets) + 1   # + reaper phase (0 handshake, 1 decision, 2 session)
+probes = reaped + 3               # connections closed without sending a byte (client/probe.py)
+n_slots = probes + 1
+
+result_names = {1: "tie", 2: "loss", 3: "win"}
+reaped_names = ("handshake", "decision", "session")
+
+_local = threading.local()
+_shards = []
+_retired = [0] * n_slots          # counts of shards whose thread has exited
+_shards_lock = threading.Lock()
+_stats_fns = []
+_routes = {}
+
+
+class _shard_owner:
+    # lives in the thread-local, so it is dropped when its thread ends and
+    # folds that thread's counts into _retired (session threads come and go)
+    def __init__(self):
+        self.counts = [0] * n_slots
+        with _shards_lock:
+            _shards.append(self.counts)
+
+    def __del__(self):
+        with _shards_lock:
+            _shards.remove(self.counts)
+            for i, v in enumerate(self.counts):
+                _retired[i] += v
+
+
+def shard():
+    # this thread's counters
+    try:
+        return _local.owner.counts
+    except AttributeError:
+        _local.owner = _shard_owner()
+        return _local.owner.counts
+
+
+def add(slot, n=1):
+    shard()[slot] += n
+
+
+def round_done(result, seconds, n_in, n_out):
+    # one call per finished round from the drivers
+    s = shard()
+    s[results + result] += 1
+    s[bytes_in] += n_in
+    s[bytes_out] += n_out
+    s[duration_sum] += seconds
+    s[duration_counts + bisect.bisect_left(duration_buckets, seconds)] += 1
+
+
+def register_stats(fn):
+    # fn() -> dict with the session pool's active / queued / admitted / rejected
+    _stats_fns.append(fn)
+
+
+def add_route(path, fn, content_type="application/json"):
+    # extra GET endpoint on the metrics port, fn(query params from parse_qs) -> str
+    _routes[path] = (fn, content_type)
+
+
+def snapshot():
+    # all shards summed, as a list indexed by the slot constants
+    with _shards_lock:
+        total = list(_retired)
+        for s in _shards:
+            for i, v in enumerate(s):
+                total[i] += v
+    return total
+
+
+def render() -> str:
+    t = snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, value, labels=""):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name}{labels} {value}")
+
+    rounds = sum(t[results + code] for code in result_names)
+    metric("blackjack_sessions_active", "gauge", "Sessions past the handshake and not finished.",
+           t[sessions_started] - t[sessions_finished])
+    metric("blackjack_sessions_started_total", "counter", "Sessions that completed the handshake.",
+           t[sessions_started])
+    metric("blackjack_sessions_finished_total", "counter", "Sessions that ended after the handshake.",
+           t[sessions_finished])
+    metric("blackjack_rounds_total", "counter", "Rounds played to a result.", rounds)
+    lines.append("# HELP blackjack_round_results_total Rounds by result for the player.")
+    lines.append("# TYPE blackjack_round_results_total counter")
+    for code, name in result_names.items():
+        lines.append(f'blackjack_round_results_total{{result="{name}"}} {t[results + code]}')
+    metric("blackjack_bytes_received_total", "counter", "Protocol bytes read from clients.", t[bytes_in])
+    metric("blackjack_bytes_sent_total", "counter", "Protocol bytes sent to clients.", t[bytes_out])
+    metric("blackjack_handshake_failures_total", "counter",
+           "Connections that sent an invalid request or left before the handshake.", t[handshake_failures])
+    metric("blackjack_connection_probes_total", "counter",
+           "Connections closed without sending a byte (client connect rtt probes).", t[probes])
+    metric("blackjack_bad_payloads_total", "counter", "Decision payloads unpack_client_payload rejected.",
+           t[bad_payloads])
+    lines.append("# HELP blackjack_connections_reaped_total Connections cut for missing a deadline, by phase.")
+    lines.append("# TYPE blackjack_connections_reaped_total counter")
+    for i, name in enumerate(reaped_names):
+        lines.append(f'blackjack_connections_reaped_total{{phase="{name}"}} {t[reaped + i]}')
+
+    name = "blackjack_round_duration_seconds"
+    lines.append(f"# HELP {name} Wall time of a round, including client think time.")
+    lines.append(f"# TYPE {name} histogram")
+    cumulative = 0
+    for i, bound in enumerate(duration_buckets + (float("inf"),)):
+        cumulative += t[duration_counts + i]
+        le = "+Inf" if i == len(duration_buckets) else repr(bound)
+        lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+    lines.append(f"{name}_sum {t[duration_sum]:.6f}")
+    lines.append(f"{name}_count {cumulative}")
+
+    for fn in _stats_fns:
+        pool = fn()
+        metric("blackjack_sessions_queued", "gauge", "Accepted connections waiting for a session slot.",
+               pool["queued"])
+        metric("blackjack_connections_rejected_total", "counter", "Connections closed because the queue was full.",
+               pool["rejected"])
+    return "\n".join(lines) + "\n"
+
+
+class _handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/metrics":
+            body = render().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif path in _routes:
+            fn, content_type = _routes[path]
+            body = fn(parse_qs(query)).encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(bind_ip="127.0.0.1", port=0) -> int:
+    # serves /metrics (and any add_route paths) from a daemon thread,
+    # returns the actual port
+    httpd = ThreadingHTTPServer((bind_ip, port), _handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_address[1]
@@ -0,0 +1,202 @@
+import asyncio
+import atexit
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import types
+from server.settings import settings
+
+# opt-in profiling (--profile / BLACKJACK_PROFILE). when it is off the
+# wrappers below hand back the original functions and no thread is started,
+# so a normal server runs exactly the code it ran before.
+#
+# when on:
+#   - a sampled fraction of sessions runs under cProfile, each one is written
+#     to <profile_dir>/session-<pid>-<n>.prof and added to a running total
+#   - threaded mode also profiles the accept loop's per-connection work
+#   - with --tracemalloc, a snapshot is taken every profile_interval seconds
+#   - <profile_dir>/report-<pid>.txt (top N by cumulative and own time, top
+#     allocation sites and their growth) is rewritten on the same interval
+#     and at exit
+
+_lock = threading.Lock()
+_session_counter = itertools.count(1)
+_total = None          # pstats.Stats of every profiled session so far
+_sessions = 0
+_accept_prof = None
+_first_snapshot = None
+_started = False
+
+
+def enabled() -> bool:
+    return settings["profile_sample"] > 0
+
+
+def start_profiling():
+    # call once per process (after forking) before the first session
+    global _started, _accept_prof
+    if not enabled() or _started:
+        return
+    _started = True
+    os.makedirs(settings["profile_dir"], exist_ok=True)
+    _accept_prof = cProfile.Profile()
+    if settings["profile_tracemalloc"]:
+        tracemalloc.start(10)
+    threading.Thread(target=_report_loop, daemon=True).start()
+    atexit.register(write_report)
+
+
+def profile_sessions(handle_client_fn):
+    # wraps a handle_client / handle_client_async so a sampled share of the
+    # sessions runs under its own profiler
+    if not enabled():
+        return handle_client_fn
+    rate = settings["profile_sample"]
+
+    if asyncio.iscoroutinefunction(handle_client_fn):
+        async def run_async(reader, writer):
+            if random.random() >= rate:
+                return await handle_client_fn(reader, writer)
+            prof = cProfile.Profile()
+            try:
+                return await _stepped(handle_client_fn(reader, writer), prof)
+            finally:
+                _session_done(prof)
+        return run_async
+
+    def run(conn, addr):
+        if random.random() >= rate:
+            return handle_client_fn(conn, addr)
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # another profiler is already active here, run this one plain
+            return handle_client_fn(conn, addr)
+        try:
+            return handle_client_fn(conn, addr)
+        finally:
+            prof.disable()
+            _session_done(prof)
+    return run
+
+
+@types.coroutine
+def _stepped(coro, prof):
+    # drives coro by hand with the profiler on only while coro itself runs.
+    # every session shares the event loop thread, so profiling the thread
+    # would mix all of them together
+    value, error = None, None
+    while True:
+        try:
+            prof.enable()
+        except ValueError:
+            prof = None
+        try:
+            yielded = coro.send(value) if error is None else coro.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            if prof is not None:
+                prof.disable()
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
+
+
+def profile_accept(executor):
+    # threaded mode: profiles what the accept loop does per connection
+    # (admission, queueing, starting the session thread)
+    if not enabled():
+        return executor
+    submit = executor.submit
+
+    def profiled_submit(conn, addr):
+        with _lock:
+            try:
+                _accept_prof.enable()
+            except ValueError:
+                # a sampled session is being profiled (3.12+ profiles the
+                # whole process), accept this one plain
+                return submit(conn, addr)
+            try:
+                return submit(conn, addr)
+            finally:
+                _accept_prof.disable()
+
+    executor.submit = profiled_submit
+    return executor
+
+
+def _session_done(prof):
+    global _total, _sessions
+    n = next(_session_counter)
+    path = os.path.join(settings["profile_dir"], f"session-{os.getpid()}-{n}.prof")
+    prof.dump_stats(path)
+    with _lock:
+        _sessions += 1
+        if _total is None:
+            _total = pstats.Stats(prof)
+        else:
+            _total.add(prof)
+
+
+def _report_loop():
+    while True:
+        time.sleep(settings["profile_interval"])
+        write_report()
+
+
+def _top_stats(stats, sort, top):
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats(sort).print_stats(top)
+    return buf.getvalue()
+
+
+def write_report():
+    # rewrites report-<pid>.txt from everything collected so far
+    global _first_snapshot
+    top = settings["profile_top"]
+    parts = []
+    with _lock:
+        parts.append(f"pid {os.getpid()}, {_sessions} profiled sessions "
+                     f"(sample {settings['profile_sample']}), {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        if _total is not None:
+            parts.append(f"== sessions: top {top} by cumulative time ==\n")
+            parts.append(_top_stats(_total, "cumulative", top))
+            parts.append(f"== sessions: top {top} by own time ==\n")
+            parts.append(_top_stats(_total, "tottime", top))
+        if _accept_prof is not None and _accept_prof.getstats():
+            accept = pstats.Stats(_accept_prof)
+            accept.dump_stats(os.path.join(settings["profile_dir"], f"accept-{os.getpid()}.prof"))
+            parts.append(f"== accept loop: top {top} by cumulative time ==\n")
+            parts.append(_top_stats(accept, "cumulative", top))
+
+    if tracemalloc.is_tracing():
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        snap.dump(os.path.join(settings["profile_dir"], f"tracemalloc-{os.getpid()}.snap"))
+        current, peak = tracemalloc.get_traced_memory()
+        parts.append(f"== tracemalloc: {current / 1024:.0f} KiB traced, peak {peak / 1024:.0f} KiB ==\n")
+        parts.append(f"-- top {top} allocation sites --\n")
+        parts.extend(f"{s}\n" for s in snap.statistics("lineno")[:top])
+        if _first_snapshot is None:
+            _first_snapshot = snap
+        else:
+            parts.append(f"-- top {top} growth since the first snapshot --\n")
+            parts.extend(f"{s}\n" for s in snap.compare_to(_first_snapshot, "lineno")[:top])
+
+    path = os.path.join(settings["profile_dir"], f"report-{os.getpid()}.txt")
+    with open(path + ".tmp", "w") as f:
+        f.write("\n".join(parts))
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,179 @@
+import asyncio
+import math
+import socket
+import threading
+import time
+from server.settings import settings
+from server import metrics
+
+# deadlines for what the client owes us, enforced by one timer wheel per
+# process instead of a timeout on every socket:
+#   handshake  the request has to arrive within handshake_timeout of connecting
+#   decision   every hit / stand within decision_timeout of the server asking
+#   session    the whole session ends within session_timeout of connecting
+# a connection past a deadline is cut (shutdown, or transport.abort() in
+# async mode), which wakes its session out of the blocked read or write.
+#
+# the wheel has n_slots slots of tick seconds, a watch sits in the slot of
+# the tick its deadline falls in. sessions only move a deadline later (a new
+# decision is due after the last one was), so expect() just stores it and
+# the wheel moves the watch along lazily once its old slot comes up. only a
+# deadline earlier than the slot a watch sits in (rare: a decision asked for
+# after an idle stretch) takes the lock.
+
+handshake, decision, session, idle = range(4)
+phase_names = ("handshake", "decision", "session")
+
+tick = 0.25
+n_slots = 512            # one turn of the wheel is 128 s, later deadlines wait for more turns
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+def _limit(seconds):
+    return seconds if seconds and seconds > 0 else math.inf
+
+
+class watch:
+    # the deadlines of one connection. expect() / idle() are called by the
+    # session, the rest by the wheel
+    __slots__ = ("wheel", "kill", "phase", "deadline", "session_deadline", "slot", "k", "reaped")
+
+    def __init__(self, wheel, kill, now):
+        self.wheel = wheel
+        self.kill = kill                 # cuts the connection
+        self.deadline = now + wheel.limits[handshake]
+        self.phase = handshake
+        self.session_deadline = now + wheel.limits[session]
+        self.slot = None                 # slot index while on the wheel
+        self.k = math.inf                # tick it is due in
+        self.reaped = None               # phase it was reaped in
+
+    def expect(self, phase):
+        # the client owes us something of this phase from now on.
+        # deadline before phase, due() reads them the other way round
+        d = time.monotonic() + self.wheel.limits[phase]
+        self.deadline = d
+        self.phase = phase
+        if d < (self.k - 1) * tick:
+            self.wheel.place(self)
+
+    def idle(self):
+        # waiting on the server side (table mode), only the session deadline counts
+        self.phase = idle
+
+    def due(self):
+        # (deadline, phase) of whatever expires first
+        phase = self.phase
+        if phase != idle and self.deadline < self.session_deadline:
+            return self.deadline, phase
+        return self.session_deadline, session
+
+    def done(self):
+        self.wheel.remove(self)
+
+
+class timer_wheel:
+    def __init__(self):
+        self.limits = (_limit(settings["handshake_timeout"]), _limit(settings["decision_timeout"]),
+                       _limit(settings["session_timeout"]))
+        self.lock = threading.Lock()
+        self.slots = [set() for _ in range(n_slots)]
+        self.now_k = int(time.monotonic() / tick)
+
+    def watch(self, kill):
+        w = watch(self, kill, time.monotonic())
+        self.place(w)
+        return w
+
+    def place(self, w):
+        with self.lock:
+            self._place(w)
+
+    def _place(self, w):
+        # with the lock held
+        if w.slot is not None:
+            self.slots[w.slot].discard(w)
+            w.slot = None
+        while True:
+            due = w.due()[0]
+            if due == math.inf:
+                w.k = math.inf
+                return
+            w.k = max(math.ceil(due / tick), self.now_k + 1)
+            # an expect() that ran while k was being worked out saw the old k
+            # and did not come here, so look at the deadline once more
+            if w.due()[0] >= due:
+                break
+        w.slot = w.k % n_slots
+        self.slots[w.slot].add(w)
+
+    def remove(self, w):
+        with self.lock:
+            if w.slot is not None:
+                self.slots[w.slot].discard(w)
+                w.slot = None
+            w.k = math.inf
+
+    def advance(self, now):
+        # runs every tick: cuts every connection past a deadline
+        expired = []
+        with self.lock:
+            target = int(now / tick)
+            while self.now_k < target:
+                self.now_k += 1
+                bucket = self.slots[self.now_k % n_slots]
+                for w in [w for w in bucket if w.k <= self.now_k]:
+                    bucket.discard(w)
+                    w.slot = None
+                    due, phase = w.due()
+                    if due <= now:
+                        w.reaped = phase
+                        w.k = math.inf
+                        expired.append(w)
+                    else:
+                        # moved later since it was placed
+                        self._place(w)
+        for w in expired:
+            metrics.add(metrics.reaped + w.reaped)
+            w.kill()
+
+    def run_thread(self):
+        while True:
+            time.sleep(tick)
+            self.advance(time.monotonic())
+
+    def run_on_loop(self, loop):
+        # async mode: the wheel ticks on the event loop, like the sessions
+        def step():
+            self.advance(time.monotonic())
+            loop.call_later(tick, step)
+        loop.call_later(tick, step)
+
+
+def _start(loop=None):
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = timer_wheel()
+            if loop is None:
+                threading.Thread(target=_wheel.run_thread, daemon=True).start()
+            else:
+                _wheel.run_on_loop(loop)
+    return _wheel
+
+
+def watch_socket(conn):
+    # threaded mode: a watch that cuts conn, the wheel thread starts on first use
+    def kill():
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    return (_wheel or _start()).watch(kill)
+
+
+def watch_stream(writer):
+    # async mode, call from the event loop
+    return (_wheel or _start(asyncio.get_running_loop())).watch(writer.transport.abort)
@@ -0,0 +1,190 @@
+"""Append-only binary store of played rounds.
+
+With --round-store PATH the server appends one fixed-size record per
+finished round. Sessions only put a tuple on a queue; a background thread
+packs whatever has queued up and writes it in one go. Rounds cut off by a
+disconnect are not recorded. Reopening a file whose last record was torn
+by a crash cuts that record off before appending.
+
+File layout: a 16 byte header (magic, version, record size) followed by
+records of `record_format` (little endian, no padding, 56 bytes):
+
+    session    u8   session id (as logged at handshake)
+    name_hash  u4   crc32 of the team name
+    start      f8   round start, unix time
+    end        f8   round end, unix time
+    result     u1   1 tie, 2 loss, 3 win (for the player)
+    n_player   u1   cards the player got
+    n_dealer   u1   cards the dealer got (hidden card included)
+    hits       u1   hits the player asked for; the round ended on a stand unless the player busted
+    player     u1[12]  card codes 0-51 (suit * 13 + rank - 1), 255 = unused
+    dealer     u1[12]
+
+read_rounds() memory-maps a file as a NumPy structured array, so analytics
+over hundreds of millions of rounds never load the file.
+
+Usage (from src/):
+    python3 -m server.main_server --round-store rounds.bin
+    python3 -m server.round_store rounds.bin      # summary
+"""
+import argparse
+import atexit
+import functools
+import os
+import queue
+import struct
+import threading
+import zlib
+
+magic = b"BJRS"
+version = 1
+header_format = "<4sHH8x"
+record_format = "<QIddBBBB12s12s"
+header_len = struct.calcsize(header_format)
+record_len = struct.calcsize(record_format)
+max_cards = 12
+unused = 0xFF
+
+_pack = struct.Struct(record_format).pack
+_writer = None
+
+
+def numpy_dtype():
+    import numpy as np
+    return np.dtype([
+        ("session", "<u8"), ("name_hash", "<u4"), ("start", "<f8"), ("end", "<f8"),
+        ("result", "u1"), ("n_player", "u1"), ("n_dealer", "u1"), ("hits", "u1"),
+        ("player", "u1", (max_cards,)), ("dealer", "u1", (max_cards,)),
+    ])
+
+
+class round_writer:
+    # owns the file and the writer thread. append() is the only call made
+    # from sessions
+    def __init__(self, path, batch=4096):
+        self.path = path
+        self.batch = batch
+        self.q = queue.SimpleQueue()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            _check_header(path)
+            # a crash can leave a torn last record. cut it off, or every
+            # record appended after it would be misaligned
+            size = os.path.getsize(path)
+            whole = header_len + (size - header_len) // record_len * record_len
+            if whole != size:
+                os.truncate(path, whole)
+        self.f = open(path, "ab")
+        if self.f.tell() == 0:
+            self.f.write(struct.pack(header_format, magic, version, record_len))
+            self.f.flush()
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append(self, session_id, name_hash, start, end, result, player_cards, dealer_cards):
+        self.q.put((session_id, name_hash, start, end, result, bytes(player_cards), bytes(dealer_cards)))
+
+    def _run(self):
+        while True:
+            batch = [self.q.get()]
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self.f.write(b"".join(_pack_record(*r) for r in batch))
+                self.f.flush()
+                self.written += len(batch)
+            if stop:
+                return
+
+    def close(self):
+        # writes out everything queued so far
+        self.q.put(None)
+        self.thread.join()
+        self.f.close()
+
+
+def _pack_record(session_id, name_hash, start, end, result, player, dealer):
+    return _pack(session_id, name_hash, start, end, result, len(player), len(dealer), len(player) - 2,
+                 player.ljust(max_cards, b"\xff"), dealer.ljust(max_cards, b"\xff"))
+
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        head = f.read(header_len)
+    if len(head) < header_len:
+        raise ValueError(f"{path}: truncated header")
+    m, v, size = struct.unpack(header_format, head)
+    if m != magic or v != version or size != record_len:
+        raise ValueError(f"{path}: not a version {version} round store")
+
+
+def start_round_store(path):
+    # one writer per process, flushed at exit
+    global _writer
+    if _writer is None:
+        _writer = round_writer(path)
+        atexit.register(_writer.close)
+    return _writer
+
+
+def session_recorder(session_id, client_name):
+    # None when the store is off, else rec(start, end, result, player_cards, dealer_cards)
+    if _writer is None:
+        return None
+    return functools.partial(_writer.append, session_id, zlib.crc32(client_name.encode()))
+
+
+def worker_path(path, idx):
+    # rounds.bin -> rounds.w2.bin, one file per worker process
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{idx}{ext}"
+
+
+def read_rounds(path):
+    # structured numpy memmap over the records of one file (a partially
+    # written last record is left out)
+    import numpy as np
+    _check_header(path)
+    n = (os.path.getsize(path) - header_len) // record_len
+    if n == 0:
+        return np.zeros(0, dtype=numpy_dtype())
+    return np.memmap(path, dtype=numpy_dtype(), mode="r", offset=header_len, shape=(n,))
+
+
+def summarize(rounds):
+    import numpy as np
+    n = len(rounds)
+    out = {"rounds": n}
+    if n == 0:
+        return out
+    counts = np.bincount(rounds["result"], minlength=4)
+    out["win"] = int(counts[3])
+    out["loss"] = int(counts[2])
+    out["tie"] = int(counts[1])
+    out["sessions"] = int(len(np.unique(rounds["session"])))
+    out["teams"] = int(len(np.unique(rounds["name_hash"])))
+    out["mean_hits"] = float(rounds["hits"].mean())
+    out["mean_dealer_cards"] = float(rounds["n_dealer"].mean())
+    out["mean_round_ms"] = float((rounds["end"] - rounds["start"]).mean() * 1000)
+    out["span_s"] = float(rounds["end"].max() - rounds["start"].min())
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("paths", nargs="+", help="round store files (one per worker)")
+    args = p.parse_args()
+    for path in args.paths:
+        s = summarize(read_rounds(path))
+        print(f"{path}: " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                                      for k, v in s.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from collections import deque
+from server.settings import settings
+
+
+class session_executor:
+    # runs at most max_sessions sessions at once, parks up to max_queued
+    # accepted connections until a slot frees up and closes anything beyond
+    # that right away, so admitted players keep their latency under overload.
+    # a finished session thread picks up the next queued connection itself.
+    def __init__(self, handle_client_fn, max_sessions=None, max_queued=None):
+        self.handle_client_fn = handle_client_fn
+        self.max_sessions = settings["max_sessions"] if max_sessions is None else max_sessions
+        self.max_queued = settings["max_queued"] if max_queued is None else max_queued
+        self.lock = threading.Lock()
+        self.waiting = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def submit(self, conn, addr) -> bool:
+        # returns False if the connection was rejected
+        with self.lock:
+            if self.active < self.max_sessions:
+                self.active += 1
+                self.admitted += 1
+            elif len(self.waiting) < self.max_queued:
+                self.waiting.append((conn, addr))
+                return True
+            else:
+                self.rejected += 1
+                conn.close()
+                return False
+
+        t = threading.Thread(target=self._run, args=(conn, addr), daemon=True)
+        t.start()
+        return True
+
+    def _run(self, conn, addr):
+        while True:
+            try:
+                self.handle_client_fn(conn, addr)
+            except Exception:
+                # handle_client already logs its own errors, never lose the slot
+                pass
+            with self.lock:
+                if not self.waiting:
+                    self.active -= 1
+                    return
+                conn, addr = self.waiting.popleft()
+                self.admitted += 1
+
+    def stats(self):
+        with self.lock:
+            return {"active": self.active, "queued": len(self.waiting),
+                    "admitted": self.admitted, "rejected": self.rejected}
+
+
+class async_session_executor:
+    # asyncio version of session_executor, used as the start_server callback.
+    # only touched from the event loop thread, so no lock.
+    def __init__(self, handle_client_fn, max_sessions=None, max_queued=None):
+        self.handle_client_fn = handle_client_fn
+        self.max_sessions = settings["max_sessions"] if max_sessions is None else max_sessions
+        self.max_queued = settings["max_queued"] if max_queued is None else max_queued
+        self.waiting = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def __call__(self, reader, writer):
+        if self.active < self.max_sessions:
+            self.active += 1
+        elif len(self.waiting) < self.max_queued:
+            # a finishing session hands its slot over by resolving this future
+            slot = asyncio.get_running_loop().create_future()
+            self.waiting.append(slot)
+            try:
+                await slot
+            except BaseException:
+                if slot in self.waiting:
+                    self.waiting.remove(slot)
+                elif slot.done() and not slot.cancelled():
+                    self._release()
+                writer.close()
+                raise
+        else:
+            self.rejected += 1
+            writer.close()
+            return
+
+        self.admitted += 1
+        try:
+            await self.handle_client_fn(reader, writer)
+        finally:
+            self._release()
+
+    def _release(self):
+        # pass the slot to the oldest waiting connection, or free it
+        while self.waiting:
+            slot = self.waiting.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {"active": self.active, "queued": len(self.waiting),
+                "admitted": self.admitted, "rejected": self.rejected}
+
+
+def format_stats(stats) -> str:
+    return (f"active={stats['active']} queued={stats['queued']} "
+            f"admitted={stats['admitted']} rejected={stats['rejected']}")
@@ -0,0 +1,81 @@
+import asyncio
+import struct
+from common.constants import client_payload_len, server_payload_len
+from common.net_utils import send_buffer
+from common.protocol_v2 import (payload_reader, decision_payloads, card_byte, pack_frame, pack_welcome,
+                                kind_cards, kind_decisions, ext_rounds)
+from server import metrics
+
+# server side of protocol v2 (common/protocol_v2.py). a v2 session swaps its
+# reader and its out for the ones here and plays the same rounds as a v1
+# session: they take and hand out v1 payloads and do the framing.
+# the round drivers count bytes as 10 per decision and 9 per card, these
+# book the difference, so bytes_in / bytes_out stay what went over the wire.
+
+
+def welcome(session_id, rounds) -> bytes:
+    frame = pack_welcome(session_id, {ext_rounds: struct.pack("!I", rounds)})
+    metrics.add(metrics.bytes_out, len(frame))
+    return frame
+
+
+class decision_reader(payload_reader):
+    # frame_reader for play_one_round / play_table_round. read_some is the
+    # session frame_reader's, which may still hold what came in with the hello
+    def __init__(self, read_some):
+        super().__init__(read_some, kind_decisions, decision_payloads, client_payload_len)
+
+    def feed(self, data):
+        before = len(self.pending)
+        super().feed(data)
+        metrics.add(metrics.bytes_in, len(data) - (len(self.pending) - before) * client_payload_len)
+
+
+class stream_decisions(decision_reader):
+    # the same for the asyncio driver, read_some is a stream_frames'
+    async def read(self, n: int):
+        while not self.pending:
+            data = await self.read_some()
+            if not data:
+                raise asyncio.IncompleteReadError(b"", n)
+            self.feed(data)
+        return self.pending.popleft()
+
+
+def _cards_frame(payloads) -> bytes:
+    frame = pack_frame(kind_cards, bytes([card_byte[p] for p in payloads]))
+    metrics.add(metrics.bytes_out, len(frame) - len(payloads) * server_payload_len)
+    return frame
+
+
+class card_buffer(send_buffer):
+    # send_buffer whose flush() sends everything added since the last one
+    # as one cards frame. the welcome goes out with the first flush
+    def __init__(self, sock, first: bytes):
+        super().__init__(sock)
+        self.parts.append(first)
+        self.cards = []
+
+    def add(self, data: bytes) -> None:
+        self.cards.append(data)
+
+    def flush(self) -> None:
+        if self.cards:
+            self.parts.append(_cards_frame(self.cards))
+            self.cards = []
+        super().flush()
+
+
+class card_writer:
+    # StreamWriter for play_one_round_async: writelines() of payloads
+    # writes one cards frame
+    def __init__(self, writer, first: bytes):
+        self.writer = writer
+        writer.write(first)
+
+    def writelines(self, payloads) -> None:
+        if payloads:
+            self.writer.write(_cards_frame(payloads))
+
+    def drain(self):
+        return self.writer.drain()
@@ -0,0 +1,30 @@
+# server tunables. main_server overwrites them from the command line before
+# anything is started, forked workers inherit whatever is set here.
+settings = {
+    "max_sessions": 10000,  # sessions played at the same time
+    "max_queued": 1000,     # accepted connections waiting for a free session slot
+    "backlog": 1024,        # listen() backlog (the kernel caps it at somaxconn)
+    "decks": 6,             # decks per session shoe
+    "penetration": 0.75,    # share of the shoe dealt before the cut card forces a reshuffle
+    "seed": 0,              # server seed, every session rng is derived from it
+    "deterministic": False, # derive session rngs from team names instead of arrival order
+    "workers": 0,           # forked worker processes (0 = single process)
+    "worker_index": 0,      # which worker this process is
+    "log_level": "info",    # server log level (debug / info / warning / error / off)
+    "log_sample": 1.0,      # share of sessions whose per-action debug lines are kept
+    "profile_sample": 0.0,  # share of sessions run under cProfile (0 = profiling off)
+    "profile_dir": "profiles",  # per-session .prof files and the report go here
+    "profile_interval": 30.0,   # seconds between reports / tracemalloc snapshots
+    "profile_top": 25,      # lines per section of the report
+    "profile_tracemalloc": False,  # also trace allocations while profiling
+    "table_seats": 0,       # seats per shared table (threaded mode), 0 = every session plays alone
+    "round_store": None,    # file every finished round is appended to (None = off, workers add .w<index>)
+    "leaderboard": False,   # keep a live leaderboard by team name
+    "leaderboard_path": None,  # json snapshot of it, reloaded at start (workers add .w<index>)
+    "leaderboard_interval": 10.0,  # seconds between snapshots
+    "handshake_timeout": 10.0,  # seconds from connect to a complete request (0 = no limit)
+    "decision_timeout": 600.0,  # seconds the client has for each hit / stand (0 = no limit)
+    "session_timeout": 3600.0,  # seconds from connect to the end of the session (0 = no limit)
+    "max_autoplay_rounds": 1000000,  # rounds one autoplay request may ask for, more are refused (0 = no limit)
+    "metrics_port": None,   # http port for /metrics on 127.0.0.1 (None = off, workers use port + index)
+}
@@ -0,0 +1,327 @@
+import queue
+import random
+import threading
+import time
+from common.net_utils import frame_reader, send_buffer
+from common.constants import request_len, client_payload_len, server_payload_len, autoplay_request_len, request_v2_len
+from common.protocol import unpack_request, is_autoplay, unpack_autoplay_request
+from common.protocol_v2 import is_hello, unpack_hello
+from common.cards import shoe, hand
+from server.game_engine import (player_turn, dealer_turn, dealer_frames, frames_not_over, next_session_id,
+                                res_loss, log_disconnect, handshake_lost, drop_stale, session_rng, new_shoe)
+from server.log import session_log
+from server.settings import settings
+from server.round_store import session_recorder
+from server.leaderboard import team_recorder
+from server import metrics
+from server import reaper
+from server.autoplay import play_autoplay, autoplay_allowed
+from server import session_v2
+
+# table mode (--table-seats N, threaded server): up to N sessions sit at one
+# table, share its shoe and its dealer. the table's dealer thread deals every
+# seat, the seats' own session threads take their hits at the same time, and
+# once every seat has stood or busted one dealer turn is played and its
+# cards go out to every seat that stood. the client protocol is unchanged.
+#
+# players arriving mid-round wait for the next deal. a seat asks for its
+# rounds up front and leaves the table after the last one (or on disconnect).
+# autoplay sessions do not sit down, they play on their own shoe as usual.
+
+
+class shared_shoe(shoe):
+    # the seats hit concurrently, so drawing takes a lock
+    def __init__(self, decks=6, penetration=0.75, rng=None):
+        super().__init__(decks, penetration, rng)
+        self.lock = threading.Lock()
+
+    def draw(self) -> int:
+        with self.lock:
+            return shoe.draw(self)
+
+
+class seat:
+    def __init__(self, name, rounds, slog):
+        self.name = name
+        self.slog = slog            # the session's log, round results go there
+        self.rounds_left = rounds   # rounds still to be dealt to this seat
+        self.inbox = queue.SimpleQueue()  # (payloads, result) from the dealer thread
+        self.player = None
+        self.dealer = None          # the table's dealer hand of the current round
+        self.deciding = False       # dealt in, has not stood / busted yet
+        self.stood = False
+        self.gone = False
+
+
+class table:
+    def __init__(self, index, seats, cards):
+        self.index = index
+        self.n_seats = seats
+        self.cards = cards
+        self.cond = threading.Condition()
+        self.seated = []     # seats playing at this table
+        self.joining = []    # seated at the next deal
+        self.playing = 0     # seats of the current round still deciding
+        self.rounds = 0
+        self.slog = session_log(f"table {index}")
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def free_seats(self) -> int:
+        # call with the scheduler lock held
+        with self.cond:
+            taken = sum(1 for s in self.seated if s.rounds_left > 0 and not s.gone) + len(self.joining)
+        return self.n_seats - taken
+
+    def join(self, s):
+        with self.cond:
+            self.joining.append(s)
+            self.cond.notify_all()
+
+    def seat_done(self, s):
+        # the seat stood or busted (or left)
+        with self.cond:
+            if s.deciding:
+                s.deciding = False
+                self.playing -= 1
+                self.cond.notify_all()
+
+    def leave(self, s):
+        with self.cond:
+            s.gone = True
+            if s in self.joining:
+                self.joining.remove(s)
+        self.seat_done(s)
+
+    def _run(self):
+        # the dealer: one round after another while anyone is seated
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.joining or any(s.rounds_left > 0 and not s.gone
+                                                               for s in self.seated))
+                self.seated = [s for s in self.seated if s.rounds_left > 0 and not s.gone] + self.joining
+                self.joining = []
+                players = list(self.seated)
+                self.playing = len(players)
+                for s in players:
+                    s.rounds_left -= 1
+                    s.deciding = True
+                    s.stood = False
+
+            self.rounds += 1
+            self.cards.start_round()
+            for s in players:
+                s.player = hand()
+                s.player.add(self.cards.draw())
+            for s in players:
+                s.player.add(self.cards.draw())
+            dealer = hand()
+            up = self.cards.draw()
+            dealer.add(up)
+            dealer.add(self.cards.draw())
+            up_frame = frames_not_over[up]
+            for s in players:
+                s.dealer = dealer
+                p1, p2 = s.player.cards
+                s.inbox.put(((frames_not_over[p1], frames_not_over[p2], up_frame), None))
+
+            with self.cond:
+                self.cond.wait_for(lambda: self.playing == 0)
+
+            # one dealer turn for everybody who stood
+            standing = [s for s in players if s.stood and not s.gone]
+            if standing:
+                dealer_turn(self.cards, dealer, self.slog)
+                for s in standing:
+                    s.inbox.put(dealer_frames(dealer, s.player.total(), s.slog))
+
+
+class table_scheduler:
+    # seats arriving players at the first table with a free seat, opening a
+    # new table (with its own shoe and dealer thread) when all are full.
+    # empty tables stay open for the next arrivals
+    def __init__(self, seats):
+        self.seats = seats
+        self.lock = threading.Lock()
+        self.tables = []
+
+    def seat(self, name, rounds, slog):
+        s = seat(name, rounds, slog)
+        with self.lock:
+            for t in self.tables:
+                if t.free_seats() > 0:
+                    break
+            else:
+                t = table(len(self.tables) + 1, self.seats, new_table_shoe(len(self.tables) + 1))
+                self.tables.append(t)
+            t.join(s)
+        return t, s
+
+    def stats(self):
+        with self.lock:
+            return {"tables": len(self.tables),
+                    "seated": sum(t.n_seats - t.free_seats() for t in self.tables),
+                    "rounds": sum(t.rounds for t in self.tables)}
+
+
+def new_table_shoe(index):
+    key = f"{settings['seed']}:table:{settings['worker_index']}:{index}"
+    return shared_shoe(settings["decks"], settings["penetration"], random.Random(key))
+
+
+_scheduler = None
+
+
+def scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = table_scheduler(settings["table_seats"])
+    return _scheduler
+
+
+def handle_table_client(conn, addr):
+    # handle_client for table mode: same handshake, then the session plays
+    # its rounds at a shared table
+    slog = session_log(f"{addr[0]}:{addr[1]}")
+    slog.info("New connection. Waiting for protocol handshake...")
+    started = False
+    req = b""
+    t = s = None
+    timer = reaper.watch_socket(conn)
+
+    try:
+        reader = frame_reader(conn)
+        req = bytes(reader.read(request_len))
+        v2 = is_hello(req)
+        if is_autoplay(req):
+            req += bytes(reader.read(autoplay_request_len - request_len))
+            parsed = unpack_autoplay_request(req)
+        elif v2:
+            req += bytes(reader.read(request_v2_len - request_len))
+            parsed = unpack_hello(req)
+        else:
+            parsed = unpack_request(req)
+        if parsed is None:
+            slog.warning("Sent invalid REQUEST packet. closing.")
+            metrics.add(metrics.handshake_failures)
+            return
+        if len(parsed) == 3 and not autoplay_allowed(parsed[0], slog):
+            metrics.add(metrics.handshake_failures)
+            return
+
+        rounds, client_name = parsed[:2]
+        slog.rename(client_name)
+        started = True
+        metrics.add(metrics.sessions_started)
+        metrics.add(metrics.bytes_in, len(req))
+        session_id = next_session_id()
+        if len(parsed) == 3:
+            rng, seed_key = session_rng(session_id, client_name)
+            slog.info("Handshake complete. Wants to play %d rounds (autoplay, stands on %d). session %d, seed %r",
+                      rounds, parsed[2], session_id, seed_key)
+            out = send_buffer(conn)
+            play_autoplay(out, new_shoe(rng), rounds, parsed[2], slog,
+                          session_recorder(session_id, client_name), team_recorder(client_name), timer)
+            return
+        if v2:
+            reader = session_v2.decision_reader(reader.read_some)
+            out = session_v2.card_buffer(conn, session_v2.welcome(session_id, rounds))
+        else:
+            out = send_buffer(conn)
+        if rounds == 0:
+            slog.info("Handshake complete. Wants to play 0 rounds. session %d", session_id)
+            out.flush()
+            return
+
+        t, s = scheduler().seat(client_name, rounds, slog)
+        slog.info("Handshake complete. Wants to play %d rounds%s. session %d, table %d",
+                  rounds, " (protocol v2)" if v2 else "", session_id, t.index)
+
+        rec = session_recorder(session_id, client_name)
+        team = team_recorder(client_name)
+        for i in range(rounds):
+            slog.action("=== Round %d/%d ===", i + 1, rounds)
+            play_table_round(reader, t, s, slog, out, rec, team, timer)
+        out.flush()
+
+    except ConnectionError:
+        if started:
+            log_disconnect(slog, timer)
+        else:
+            handshake_lost(slog, timer, req or reader.buffered())
+
+    except Exception as e:
+        slog.exception("Server Error: %s", e)
+    finally:
+        timer.done()
+        if s is not None:
+            t.leave(s)
+        if started:
+            metrics.add(metrics.sessions_finished)
+        try:
+            conn.close()
+            slog.info("Connection closed.")
+        except Exception:
+            pass
+
+
+def play_table_round(reader, t, s, slog, out, rec=None, team=None, timer=None):
+    # one round of one seat: the deal from the dealer thread, this seat's
+    # hits and stand, then the shared dealer turn (unless it busted).
+    # waiting on the other seats is not held against the client's timer.
+    # out is flushed before every wait on the inbox and once the result is
+    # known, so a seat never waits on the table with payloads still queued
+    out.flush()
+    if timer is not None:
+        timer.idle()
+    payloads, _ = s.inbox.get()
+    start = time.perf_counter()
+    started_at = time.time()
+    for p in payloads:
+        out.add(p)
+    sent = len(payloads)
+    reads = 0
+
+    steps = player_turn(t.cards, s.player, slog)
+    try:
+        payload = next(steps)
+        while True:
+            if payload is None:
+                if reader.buffered() < client_payload_len:
+                    out.flush()
+                    if timer is not None:
+                        timer.expect(reaper.decision)
+                reads += 1
+                payload = steps.send(reader.read(client_payload_len))
+            else:
+                sent += 1
+                out.add(payload)
+                payload = next(steps)
+    except StopIteration as stop:
+        busted = stop.value
+    except BaseException:
+        t.seat_done(s)
+        raise
+
+    s.stood = not busted
+    t.seat_done(s)
+    reads += drop_stale(reader, slog)
+    if busted:
+        result = res_loss
+    else:
+        # comes once every seat at the table is done
+        out.flush()
+        if timer is not None:
+            timer.idle()
+        payloads, result = s.inbox.get()
+        for p in payloads:
+            out.add(p)
+        sent += len(payloads)
+    out.flush()
+
+    metrics.round_done(result, time.perf_counter() - start, reads * client_payload_len, sent * server_payload_len)
+    if rec is not None:
+        # a busted seat only knows the dealer's first two cards
+        rec(started_at, time.time(), result, s.player.cards, s.dealer.cards if not busted else s.dealer.cards[:2])
+    if team is not None:
+        team(result)
+    return result
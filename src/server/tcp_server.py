@@ -1,15 +1,24 @@
 import socket
 import threading
+from server.settings import settings
+from server.session_pool import session_executor
 
 
-def  run_tcp_server(bind_ip: str, bind_port: int, handle_client_fn):
+def  run_tcp_server(bind_ip: str, bind_port: int, handle_client_fn, reuse_port=False, executor=None):
     # create tcp server socket
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # several worker processes listen on the same port, kernel spreads connections
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
     # bind + listen
     s.bind((bind_ip, bind_port))
-    s.listen()
+    s.listen(settings["backlog"])
+
+    # caps concurrent sessions, queues or rejects the overflow
+    if executor is None:
+        executor = session_executor(handle_client_fn)
 
     # actual port (if bind_port = 0)
     actual_port = s.getsockname()[1]
@@ -22,13 +31,11 @@ def  run_tcp_server(bind_ip: str, bind_port: int, handle_client_fn):
                 # socket closed so stop thread
                 break
 
-            # handle each client in its own thread
-            t = threading.Thread(
-                target=handle_client_fn,
-                args=(conn, addr),
-                daemon=True
-            )
-            t.start()
+            # small packets must not wait for acks (asyncio does this by default)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            # handle each admitted client in its own thread
+            executor.submit(conn, addr)
 
     t = threading.Thread(target=accept_loop, daemon=True)
     t.start()
@@ -1,11 +1,13 @@
 import socket
 import time
 from common.constants import udp_offer_port
-from common.protocol import pack_offer
+from common.protocol import pack_offer, pack_load
 
 
-def run_udp_broadcaster(tcp_port: int, server_name: str, stop_flag):
-    # broadcasts offer every 1 second
+def run_udp_broadcaster(tcp_port: int, server_name: str, stop_flag, load_fn=None):
+    # broadcasts offer every 1 second.
+    # with load_fn (-> (active, queued, capacity)) a load packet follows
+    # every offer, so clients can pick the least loaded server
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
@@ -16,6 +18,8 @@ def run_udp_broadcaster(tcp_port: int, server_name: str, stop_flag):
             try:
                 msg = pack_offer(tcp_port, server_name)
                 s.sendto(msg, ("<broadcast>", udp_offer_port))
+                if load_fn is not None:
+                    s.sendto(pack_load(tcp_port, *load_fn()), ("<broadcast>", udp_offer_port))
             except Exception:
                 # ignore transient network errors, keep broadcasting
                 pass
@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import socket
+import time
+from server.tcp_server import run_tcp_server
+from server.async_server import run_async_server, handle_client_async
+from server.game_engine import handle_client
+from server.table import handle_table_client
+from server.session_pool import session_executor, async_session_executor
+from server.settings import settings
+from server.log import setup_logging
+from server import metrics
+from server.profiling import start_profiling, profile_sessions, profile_accept
+from server.round_store import start_round_store, worker_path
+from server import leaderboard
+
+
+def reserve_port(bind_ip: str, bind_port: int):
+    # bound (not listening) SO_REUSEPORT socket, so every worker gets the same
+    # port even when bind_port is 0. connections only go to listening sockets.
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((bind_ip, bind_port))
+    return s, s.getsockname()[1]
+
+
+# per worker slots in the shared stats array
+stat_fields = ("active", "queued", "rejected")
+
+
+def start_serving(mode, bind_ip, port, idx=None):
+    # everything a serving process sets up, the single-process server and
+    # every worker alike: logging, profiling, round store, leaderboard, the
+    # session server and its metrics. idx is the worker index (None without
+    # --workers): workers share the port and write their own files.
+    # returns (executor, tcp port, metrics port or None)
+    own = (lambda path: path) if idx is None else (lambda path: worker_path(path, idx))
+    setup_logging(settings["log_level"], settings["log_sample"])
+    start_profiling()
+    if settings["round_store"]:
+        start_round_store(own(settings["round_store"]))
+    if settings["leaderboard"]:
+        path = settings["leaderboard_path"]
+        leaderboard.start_leaderboard(path and own(path), settings["leaderboard_interval"])
+        metrics.add_route("/leaderboard", leaderboard.top_json)
+    if mode == "async":
+        executor = async_session_executor(profile_sessions(handle_client_async))
+        port = run_async_server(bind_ip, port, reuse_port=idx is not None, executor=executor)
+    else:
+        handle = handle_table_client if settings["table_seats"] else handle_client
+        executor = profile_accept(session_executor(profile_sessions(handle)))
+        port = run_tcp_server(bind_ip, port, handle, reuse_port=idx is not None, executor=executor)
+    metrics.register_stats(executor.stats)
+    metrics_port = None
+    if settings["metrics_port"] is not None:
+        metrics_port = metrics.start_metrics_server("127.0.0.1", settings["metrics_port"] + (idx or 0))
+    return executor, port, metrics_port
+
+
+def worker_main(idx, mode, bind_ip, port, stats, ready, parent_pid):
+    settings["workers"] = len(stats) // len(stat_fields)
+    settings["worker_index"] = idx
+    try:
+        executor, _, _ = start_serving(mode, bind_ip, port, idx)
+        ready.release()
+
+        # serve until the parent goes away (even if it was killed),
+        # publishing this worker's session counters once a second
+        base = idx * len(stat_fields)
+        while os.getppid() == parent_pid:
+            current = executor.stats()
+            for i, field in enumerate(stat_fields):
+                stats[base + i] = current[field]
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(n: int, mode: str, bind_ip: str, bind_port: int):
+    # forks n server processes listening on one shared port.
+    # returns (port, stats), stats holds stat_fields for every worker
+    ctx = multiprocessing.get_context("fork")
+    stats = ctx.Array("i", n * len(stat_fields), lock=False)
+    ready = ctx.Semaphore(0)
+    reserved, port = reserve_port(bind_ip, bind_port)
+
+    # fork before the parent starts any thread of its own (main_server sets up
+    # logging, whose listener is a thread, only after this returns), so no
+    # worker inherits a lock or queue whose owning thread it does not have
+    procs = []
+    for idx in range(n):
+        p = ctx.Process(target=worker_main, args=(idx, mode, bind_ip, port, stats, ready, os.getpid()), daemon=True)
+        p.start()
+        procs.append(p)
+
+    # keep the port reserved until every worker is listening on it. a worker
+    # that dies in setup (bind, round store, ...) never signals, stop waiting
+    # for it as soon as it is gone
+    deadline = time.monotonic() + 10
+    started = 0
+    while started < n:
+        if ready.acquire(timeout=0.1):
+            started += 1
+            continue
+        dead = [idx for idx, p in enumerate(procs) if p.exitcode is not None]
+        if dead or time.monotonic() > deadline:
+            for p in procs:
+                p.terminate()
+            reserved.close()
+            if dead:
+                raise RuntimeError(f"worker {dead[0]} exited with code {procs[dead[0]].exitcode} during startup")
+            raise RuntimeError(f"only {started} of {n} workers started listening")
+    reserved.close()
+    return port, stats
+
+
+def worker_load(stats):
+    # (active, queued) summed over the workers
+    n = len(stat_fields)
+    return (sum(stats[i] for i in range(0, len(stats), n)),
+            sum(stats[i + 1] for i in range(0, len(stats), n)))
+
+
+def print_worker_status(stats):
+    # one line per worker plus the total, refreshed by the workers every second
+    n = len(stat_fields)
+    rows = [list(stats[i:i + n]) for i in range(0, len(stats), n)]
+    for idx, row in enumerate(rows):
+        print(f"  worker {idx}: " + " ".join(f"{f}={v}" for f, v in zip(stat_fields, row)))
+    totals = [sum(col) for col in zip(*rows)]
+    print("  total:    " + " ".join(f"{f}={v}" for f, v in zip(stat_fields, totals)))
@@ -1,3 +1,4 @@
+import random
 import socket
 import time
 
@@ -8,9 +9,13 @@ import time
 try:
     from server.tcp_server import run_tcp_server
     from server.game_engine import handle_client, res_not_over, res_tie, res_loss, res_win
-    from common.protocol import pack_request, pack_client_payload, unpack_server_payload
+    from common.protocol import (pack_request, pack_client_payload, unpack_server_payload,
+                                 pack_autoplay_request, unpack_results_header)
+    from common.protocol_v2 import (pack_hello, pack_frame, unpack_welcome, client_reader, kind_welcome,
+                                    kind_decisions)
     from common.net_utils import recv_exact
-    from common.constants import server_payload_len
+    from common.constants import server_payload_len, results_header_len
+    from server.log import setup_logging
 except ImportError:
     raise ImportError(
         "Unable to import required modules. Make sure the project includes "
@@ -36,6 +41,20 @@ class AlwaysStand:
         return None
 
 
+class RandomStrategy:
+    """Decision strategy that hits or stands at random until it stands, then does nothing."""
+    def __init__(self):
+        self.stood = False
+
+    def next_decision(self):
+        if self.stood:
+            return None
+        if random.random() < 0.5:
+            return b"Hittt"
+        self.stood = True
+        return b"Stand"
+
+
 def run_session(tcp_port, strategy_factory, rounds=1):
     """Connects to the server and plays a given number of rounds using a strategy.
 
@@ -80,6 +99,104 @@ def run_session(tcp_port, strategy_factory, rounds=1):
     return results
 
 
+def run_pipelined_session(tcp_port, hits, rounds=1):
+    """Plays rounds that send all decisions at once: `hits` Hittt payloads and a Stand
+    in a single write right after the deal, without waiting for any card.
+
+    The server answers the hits in order, stops at a bust and drops whatever was
+    sent past the end of the round, so every round must still end with exactly one
+    result and the next round must start cleanly.
+
+    Returns:
+        list[int]: A list of result codes for each round.
+    """
+    conn = socket.create_connection(("127.0.0.1", tcp_port))
+    conn.sendall(pack_request(rounds, "Pipeliner"))
+    plan = pack_client_payload(b"Hittt") * hits + pack_client_payload(b"Stand")
+    results = []
+    for _ in range(rounds):
+        for _ in range(3):
+            recv_exact(conn, server_payload_len)
+        conn.sendall(plan)
+        while True:
+            res_code, card = unpack_server_payload(recv_exact(conn, server_payload_len))
+            if res_code != res_not_over:
+                results.append(res_code)
+                break
+    conn.close()
+    return results
+
+
+def run_autoplay_session(tcp_port, rounds, stand_on=17):
+    """Asks the server to play `rounds` rounds itself, standing on `stand_on`.
+
+    Returns:
+        list[int]: The result codes from the server's results frames.
+    """
+    conn = socket.create_connection(("127.0.0.1", tcp_port))
+    conn.sendall(pack_autoplay_request(rounds, stand_on, "AutoClient"))
+    results = []
+    while len(results) < rounds:
+        count = unpack_results_header(recv_exact(conn, results_header_len))
+        results.extend(recv_exact(conn, count))
+    conn.close()
+    return results
+
+
+def run_v2_session(tcp_port, hits, rounds=1):
+    """Like run_pipelined_session over protocol v2: a hello, the welcome frame, then
+    each round's plan as one decisions frame and the cards as cards frames.
+
+    Returns:
+        tuple: (welcome as (version, session id, extensions), list of result codes)
+    """
+    conn = socket.create_connection(("127.0.0.1", tcp_port))
+    conn.sendall(pack_hello(rounds, "FrameClient"))
+    reader = client_reader(conn)
+    kind, body = reader.next_other()
+    welcome = unpack_welcome(body) if kind == kind_welcome else None
+    plan = pack_frame(kind_decisions, b"H" * hits + b"S")
+    results = []
+    for _ in range(rounds):
+        for _ in range(3):
+            reader.read(server_payload_len)
+        conn.sendall(plan)
+        while True:
+            res_code, card = unpack_server_payload(reader.read(server_payload_len))
+            if res_code != res_not_over:
+                results.append(res_code)
+                break
+    conn.close()
+    return welcome, results
+
+
+def check_round_store_torn_tail():
+    """Reopens a round store whose last record was torn (as after a crash) and appends to it.
+
+    Returns:
+        bool: True if the torn bytes were cut off and the new record sits on a record boundary.
+    """
+    import os
+    import struct
+    import tempfile
+    from server.round_store import round_writer, header_len, record_len, record_format
+
+    path = os.path.join(tempfile.mkdtemp(), "rounds.bin")
+    w = round_writer(path)
+    for sid in (1, 2, 3):
+        w.append(sid, 0, 0.0, 0.0, res_win, b"\x00\x01", b"\x02\x03")
+    w.close()
+    with open(path, "ab") as f:
+        f.write(b"\xee" * (record_len // 2))  # half a record
+    w = round_writer(path)
+    w.append(4, 0, 0.0, 0.0, res_loss, b"\x00\x01", b"\x02\x03")
+    w.close()
+    with open(path, "rb") as f:
+        data = f.read()
+    last = struct.unpack(record_format, data[-record_len:])
+    return len(data) == header_len + 4 * record_len and last[0] == 4 and last[4] == res_loss
+
+
 def stress_test_server():
     """Runs a comprehensive suite of tests covering both normal edge cases and more
     aggressive stress scenarios. A server instance will be started on a free
@@ -195,18 +312,6 @@ def stress_test_server():
     # ---------------------------------------------------------------------------
     # 4. Random strategies to explore diverse outcomes
     # ---------------------------------------------------------------------------
-    import random
-    class RandomStrategy:
-        """Randomly chooses to hit or stand on the first decision. There is no
-        follow-up decision because the server only expects one."""
-        def __init__(self):
-            self.first = True
-        def next_decision(self):
-            if not self.first:
-                return None
-            self.first = False
-            return b"Hittt" if random.random() < 0.5 else b"Stand"
-
     # Run multiple sessions using RandomStrategy to ensure a mix of outcomes occurs and
     # no crashes happen.
     random_results = []
@@ -218,6 +323,32 @@ def stress_test_server():
     counts = Counter(random_results)
     print("[TEST] Random strategy distribution:", counts)
 
+    # Pipelined decisions: hits and a stand sent ahead in one write. Plans that
+    # bust early leave decisions behind, which must not leak into the next round.
+    for hits in (0, 1, 3, 12):
+        piped = run_pipelined_session(port, hits, rounds=10)
+        print(f"[TEST] Pipelined {hits} hits + stand, 10 rounds:", len(piped) == 10, piped)
+
+    # Protocol v2: the same pipelined plans in length-prefixed frames, next to the
+    # v1 sessions on the same server.
+    for hits in (0, 2, 12):
+        welcome, v2_results = run_v2_session(port, hits, rounds=10)
+        print(f"[TEST] Protocol v2 {hits} hits + stand, 10 rounds:", welcome is not None and welcome[0] == 2
+              and len(v2_results) == 10, v2_results)
+
+    # Autoplay: the server plays every round and streams one result byte per round
+    # (more rounds than fit in one results frame).
+    auto = run_autoplay_session(port, 5000)
+    print("[TEST] Autoplay 5000 rounds, all results valid:", len(auto) == 5000 and set(auto) <= {res_tie, res_loss, res_win},
+          Counter(auto))
+    # More rounds than the server's max_autoplay_rounds: refused at the handshake.
+    try:
+        run_autoplay_session(port, 2 ** 32 - 1)
+        refused = False
+    except ConnectionError:
+        refused = True
+    print("[TEST] Autoplay over the round limit refused:", refused)
+
     # ---------------------------------------------------------------------------
     # 5. Concurrent sessions
     # ---------------------------------------------------------------------------
@@ -234,6 +365,12 @@ def stress_test_server():
         t.join()
     print("[TEST] Concurrent sessions results:", concurrent_results)
 
+    # ---------------------------------------------------------------------------
+    # 6. Round store survives a torn last record
+    # ---------------------------------------------------------------------------
+    print("[TEST] Round store reopened after a torn record stays aligned:", check_round_store_torn_tail())
+
 
 if __name__ == "__main__":
+    setup_logging("debug")  # show every server action next to the test output
     stress_test_server()
\ No newline at end of file